@@ -4,6 +4,8 @@ from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
 
+from fsnd_shared.token_cache import VerifiedTokenCache
+
 
 app = Flask(__name__)
 
@@ -11,6 +13,9 @@ AUTH0_DOMAIN = 'dev-paula-fwd.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'image'
 
+# payloads of tokens that already passed verify_decode_jwt
+token_cache = VerifiedTokenCache(maxsize=1024)
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -109,10 +114,13 @@ def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = verify_decode_jwt(token)
+            except:
+                abort(401)
+            token_cache.put(token, payload)
         return f(payload, *args, **kwargs)
 
     return wrapper
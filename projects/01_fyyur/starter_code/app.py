@@ -5,16 +5,23 @@
 import json
 import dateutil.parser
 import babel
+import babel.dates
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, and_, or_, text, event, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import validates
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
 from datetime import timedelta
+from itertools import groupby
+from functools import lru_cache
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -28,10 +35,33 @@ db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 # TODO: connect to a local postgresql database
 
+SEARCH_RESULTS_PER_PAGE = 20
+SHOWS_PER_PAGE = 30
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+# the primary keys serve the genres of one venue or artist,
+# the (genre_id, ...) indexes serve the /venues?genre= and /artists?genre= filters
+venue_genres = db.Table('VenueGenre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_VenueGenre_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('ArtistGenre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -42,9 +72,12 @@ class Venue(db.Model):
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String())
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', lazy=True)
     facebook_link = db.Column(db.String())
     venue_artist = db.relationship('Show', backref= 'show_venue' , lazy=True, cascade="all, delete")
+    # maintained by the Show events and roll_over_show_counters(), see Show counters below
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -56,30 +89,153 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', lazy=True)
     image_link = db.Column(db.String())
     facebook_link = db.Column(db.String())
     show_artist = db.relationship('Show', backref= 'show_artist', lazy=True, cascade="all, delete")
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
     __tablename__ = 'Show'
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
-    start_time= db.Column(db.DateTime(), primary_key=True)
+    __table_args__ = (
+      db.UniqueConstraint('artist_id', 'venue_id', 'start_time', name='uq_Show_artist_id_venue_id_start_time'),
+      # the venue and artist pages, and the shows listing ordered by time
+      db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+      db.Index('ix_Show_start_time', 'start_time'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_time= db.Column(db.DateTime(), nullable=False)
+
+    @validates('start_time')
+    def parse_start_time(self, key, start_time):
+      # the show form posts the start time as a string
+      if isinstance(start_time, str):
+        return dateutil.parser.parse(start_time)
+      return start_time
+
+class ShowCounterRollover(db.Model):
+    # a single row: the show counters count shows starting after rolled_at as upcoming
+    __tablename__ = 'ShowCounterRollover'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime(), nullable=False)
+
+# seeded with the table, as the migration does, so requests never race to create the row
+@event.listens_for(ShowCounterRollover.__table__, 'after_create')
+def seed_show_counter_rollover(table, connection, **kw):
+  connection.execute(table.insert().values(id=1, rolled_at=datetime.now()))
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+def genres_named(names):
+  # the Genre rows of the given names, created for names not seen before.
+  # another request may create the same genre in between, so a conflict on the unique name
+  # reads the row it created: postgresql inserts with ON CONFLICT DO NOTHING and selects,
+  # other databases insert each name in a savepoint and select when it fails
+  names = sorted(set(name.strip() for name in names if name.strip()))
+  if not names:
+    return []
+  genres = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))}
+  missing = [name for name in names if name not in genres]
+  if missing and db.engine.dialect.name == 'postgresql':
+    db.session.execute(postgresql.insert(Genre.__table__).values([{'name': name} for name in missing]).on_conflict_do_nothing(index_elements=['name']))
+    genres.update((genre.name, genre) for genre in Genre.query.filter(Genre.name.in_(missing)))
+  else:
+    for name in missing:
+      try:
+        with db.session.begin_nested():
+          genres[name] = Genre(name=name)
+          db.session.add(genres[name])
+      except IntegrityError:
+        genres[name] = Genre.query.filter(Genre.name == name).one()
+  return [genres[name] for name in names]
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+def counters_rolled_at(connection, exclusive=False):
+  # read under a row lock, so a show written while the counters roll over waits for the rollover
+  query = select([ShowCounterRollover.rolled_at]).where(ShowCounterRollover.id == 1).with_for_update(read=not exclusive)
+  return connection.execute(query).scalar()
+
+def adjust_show_counters(connection, show, delta):
+  column = 'num_upcoming_shows' if show.start_time > counters_rolled_at(connection) else 'num_past_shows'
+  for table, entity_id in [(Venue.__table__, show.venue_id), (Artist.__table__, show.artist_id)]:
+    connection.execute(table.update().where(table.c.id == entity_id).values({column: table.c[column] + delta}))
+
+# in the flush of the show itself, so the counters commit or roll back with it
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+  adjust_show_counters(connection, show, 1)
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  adjust_show_counters(connection, show, -1)
+
+def roll_over_show_counters(now=None):
+  # moves the shows that started since the last rollover from the upcoming to the past counters,
+  # returns the number of shows moved
+  now = now or datetime.now()
+  rolled_at = counters_rolled_at(db.session.connection(), exclusive=True)
+  moved = 0
+  if now > rolled_at:
+    started = and_(Show.start_time > rolled_at, Show.start_time <= now)
+    for model, show_fk in [(Venue, Show.venue_id), (Artist, Show.artist_id)]:
+      # one UPDATE ... FROM (SELECT fk, count(*) ... GROUP BY fk) per table, however many venues or artists moved
+      counts = db.session.query(show_fk.label('entity_id'), func.count().label('started')).filter(started).group_by(show_fk).subquery()
+      table = model.__table__
+      result = db.session.execute(table.update()
+        .where(table.c.id == counts.c.entity_id)
+        .values({
+          table.c.num_upcoming_shows: table.c.num_upcoming_shows - counts.c.started,
+          table.c.num_past_shows: table.c.num_past_shows + counts.c.started
+        })
+        .returning(counts.c.started))
+      if model is Venue:
+        moved = sum(count for count, in result)
+    ShowCounterRollover.query.filter(ShowCounterRollover.id == 1).update({ShowCounterRollover.rolled_at: now}, synchronize_session=False)
+  db.session.commit()
+  return moved
+
+@app.cli.command('roll-show-counters')
+def roll_show_counters_command():
+  # run periodically, e.g. every 5 minutes from cron: FLASK_APP=app.py flask roll-show-counters
+  print('{} shows moved to past'.format(roll_over_show_counters()))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # the compiled Babel pattern and the Locale, parsed once per format and locale
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=None):
+  # pages repeat the same start times render after render, so the output is memoized.
+  # datetimes from the database are formatted as they are, strings are parsed first,
+  # and like babel.dates.format_datetime naive values are taken as UTC
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=babel.dates.UTC)
+  pattern, locale = datetime_pattern(format, locale or babel.dates.LC_TIME)
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -120,9 +276,24 @@ def venues():
   #     "num_upcoming_shows": 0,
   #   }]
   # }]
-  data = Venue.query.with_entities(Venue.city,Venue.state).distinct()
-  venues = Venue.query.all()
-  return render_template('pages/venues.html', areas=data, venues = venues);
+  genre = request.args.get('genre')
+  return render_template('pages/venues.html', areas=venue_areas(genre), genre=genre)
+
+def venue_areas(genre=None):
+  # every venue, or the venues of a genre, with its maintained upcoming show counter,
+  # ordered by area so the rows can be grouped into areas in a single pass
+  query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.num_upcoming_shows)
+  if genre:
+    query = with_genre(query, Venue, venue_genres.c.venue_id, venue_genres.c.genre_id, genre)
+  rows = query.order_by(Venue.state, Venue.city, Venue.id).all()
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      'city': city,
+      'state': state,
+      'venues': [{'id': venue.id, 'name': venue.name, 'num_upcoming_shows': venue.num_upcoming_shows} for venue in venues]
+    })
+  return areas
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -137,9 +308,26 @@ def search_venues():
   #     "num_upcoming_shows": 0,
   #   }]
   # }
-  response = Venue.query.filter(Venue.name.like("%{}%".format(request.form.get('search_term')))).all()
-  count = Venue.query.filter(Venue.name.like("%{}%".format(request.form.get('search_term')))).count()
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''), count = count)
+  page = max(request.form.get('page', 1, type=int), 1)
+  response, count = search_by_name(Venue, request.form.get('search_term', ''), page)
+  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''), count = count, page = page, per_page = SEARCH_RESULTS_PER_PAGE)
+
+def search_by_name(model, search_term, page=1):
+  # one query for the page of results and the total count, served by the
+  # trigram index on name (see migrations) on postgresql.
+  # case-insensitive substring match, plus trigram similarity for typos on postgresql
+  pattern = '%{}%'.format(search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+  match = model.name.ilike(pattern, escape='\\')
+  order = [model.name, model.id]
+  if db.engine.dialect.name == 'postgresql' and search_term:
+    # pg_trgm similarity operator, as text() so the % is escaped for the driver
+    match = or_(match, text('"{}".name % :search_term'.format(model.__tablename__)).bindparams(search_term=search_term))
+    order = [func.similarity(model.name, search_term).desc()] + order
+  page = max(page, 1)
+  rows = db.session.query(model.id, model.name, model.num_upcoming_shows, func.count().over().label('count')).filter(match).order_by(*order).limit(SEARCH_RESULTS_PER_PAGE).offset((page - 1) * SEARCH_RESULTS_PER_PAGE).all()
+  if rows:
+    return rows, rows[0].count
+  return rows, 0 if page == 1 else model.query.filter(match).count()
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
@@ -223,14 +411,50 @@ def show_venue(venue_id):
   #   "upcoming_shows_count": 1,
   # }
   # data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_venue.html',  venue = Venue.query.get(venue_id), 
-  past_shows_count = Show.query.filter(Show.start_time < datetime.now(), Show.venue_id == venue_id).count(), 
-  upcoming_shows_count = Show.query.filter(Show.start_time > datetime.now(), Show.venue_id == venue_id).count(),
-  upcoming_shows = db.session.query(Show, Artist).with_entities(Artist.id.label('artist_id'), Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), Show.start_time).filter(Show.artist_id == Artist.id, Show.venue_id == venue_id, Show.start_time > datetime.now()).all(),
-  past_shows =db.session.query(Show, Venue).with_entities(Artist.id.label('artist_id'), Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), Show.start_time).filter(Show.artist_id == Artist.id, Show.venue_id == venue_id, Show.start_time < datetime.now()).all(),
+  data = load_with_shows(Venue, venue_id, Show.venue_id, Artist, Show.artist_id, 'artist')
+  return render_template('pages/show_venue.html',  venue = data['entity'],
+  past_shows_count = data['past_shows_count'],
+  upcoming_shows_count = data['upcoming_shows_count'],
+  upcoming_shows = data['upcoming_shows'],
+  past_shows = data['past_shows'],
   seeking_talent = True,
   seeking_description = "We are on the lookout for a local artist to play every two weeks. Please call us.")
 
+def with_shows_query(model, entity_id, show_fk, counterpart, counterpart_fk):
+  # the entity, all of its shows and the counterpart of each show,
+  # the shows are read through the (venue_id, start_time) or (artist_id, start_time) index
+  return db.session.query(model, Show.start_time, counterpart.id, counterpart.name, counterpart.image_link).outerjoin(Show, show_fk == model.id).outerjoin(counterpart, counterpart.id == counterpart_fk).filter(model.id == entity_id).order_by(Show.start_time)
+
+def load_with_shows(model, entity_id, show_fk, counterpart, counterpart_fk, prefix):
+  # the entity, all of its shows and the counterpart of each show in one round trip,
+  # split into past and upcoming against a single timestamp
+  rows = with_shows_query(model, entity_id, show_fk, counterpart, counterpart_fk).all()
+  if not rows:
+    abort(404)
+  now = datetime.now()
+  past_shows = []
+  upcoming_shows = []
+  for _, start_time, counterpart_id, name, image_link in rows:
+    if start_time is None:
+      continue
+    show = {
+      prefix + '_id': counterpart_id,
+      prefix + '_name': name,
+      prefix + '_image_link': image_link,
+      'start_time': start_time
+    }
+    if start_time > now:
+      upcoming_shows.append(show)
+    else:
+      past_shows.append(show)
+  return {
+    'entity': rows[0][0],
+    'past_shows': past_shows,
+    'upcoming_shows': upcoming_shows,
+    'past_shows_count': len(past_shows),
+    'upcoming_shows_count': len(upcoming_shows)
+  }
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -244,7 +468,7 @@ def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
   try:
-    venue = Venue(name=request.form['name'], city=request.form['city'], state=request.form['state'], address=request.form['address'], phone=request.form['phone'], image_link=request.form['image_link'], genres=request.form['genres'], facebook_link=request.form['facebook_link'])
+    venue = Venue(name=request.form['name'], city=request.form['city'], state=request.form['state'], address=request.form['address'], phone=request.form['phone'], image_link=request.form['image_link'], genres=genres_named(request.form.getlist('genres')), facebook_link=request.form['facebook_link'])
     db.session.add(venue)
     db.session.commit()
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -269,8 +493,11 @@ def delete_venue(venue_id):
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  Venue.query.filter_by(id=venue_id).delete()
-  db.session.commit()
+  # through the session, so the shows are deleted by the cascade and counted out of their artists
+  venue = Venue.query.get(venue_id)
+  if venue is not None:
+    db.session.delete(venue)
+    db.session.commit()
   return None
 
 #  Artists
@@ -288,8 +515,17 @@ def artists():
   #   "id": 6,
   #   "name": "The Wild Sax Band",
   # }]
-  data = Artist.query.with_entities(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=data)
+  genre = request.args.get('genre')
+  query = Artist.query.with_entities(Artist.id, Artist.name)
+  if genre:
+    query = with_genre(query, Artist, artist_genres.c.artist_id, artist_genres.c.genre_id, genre)
+  data = query.all()
+  return render_template('pages/artists.html', artists=data, genre=genre)
+
+def with_genre(query, model, association_fk, association_genre_id, genre):
+  # restricts the query to the rows of the named genre: the genre by its unique name,
+  # then its rows through the (genre_id, ...) index of the association table
+  return query.join(association_fk.table, association_fk == model.id).join(Genre, Genre.id == association_genre_id).filter(Genre.name == genre)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -304,9 +540,9 @@ def search_artists():
   #     "num_upcoming_shows": 0,
   #   }]
   # }
-  response = Artist.query.filter(Artist.name.like("%{}%".format(request.form.get('search_term')))).all()
-  count = Artist.query.filter(Artist.name.like("%{}%".format(request.form.get('search_term')))).count()
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''), count = count)
+  page = max(request.form.get('page', 1, type=int), 1)
+  response, count = search_by_name(Artist, request.form.get('search_term', ''), page)
+  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''), count = count, page = page, per_page = SEARCH_RESULTS_PER_PAGE)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
@@ -384,12 +620,13 @@ def show_artist(artist_id):
   #   "upcoming_shows_count": 3,
   # }
   #data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
+  data = load_with_shows(Artist, artist_id, Show.artist_id, Venue, Show.venue_id, 'venue')
   return render_template('pages/show_artist.html' , 
-  artist = Artist.query.get(artist_id), 
-  past_shows_count = Show.query.filter(Show.start_time < datetime.now(), Show.artist_id == artist_id).count(), 
-  upcoming_shows_count = Show.query.filter(Show.start_time > datetime.now(), Show.artist_id == artist_id).count(),
-  upcoming_shows = db.session.query(Show, Venue).with_entities(Venue.id.label('venue_id'), Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link'), Show.start_time).filter(Show.venue_id == Venue.id, Show.artist_id == artist_id, Show.start_time > datetime.now()).all(),
-  past_shows =db.session.query(Show, Venue).with_entities(Venue.id.label('venue_id'), Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link'), Show.start_time).filter(Show.venue_id == Venue.id, Show.artist_id == artist_id, Show.start_time < datetime.now()).all(),
+  artist = data['entity'], 
+  past_shows_count = data['past_shows_count'], 
+  upcoming_shows_count = data['upcoming_shows_count'],
+  upcoming_shows = data['upcoming_shows'],
+  past_shows = data['past_shows'],
   seeking_talent = True,
   seeking_description = "We are on the lookout for a local artist to play every two weeks. Please call us."
   )
@@ -412,7 +649,7 @@ def edit_artist_submission(artist_id):
   artist.city=request.form['city']
   artist.state=request.form['state']
   artist.phone=request.form['phone']
-  artist.genres=request.form['genres']
+  artist.genres=genres_named(request.form.getlist('genres'))
   artist.image_link=request.form['image_link']
   artist.facebook_link=request.form['facebook_link']
   db.session.commit()
@@ -436,7 +673,7 @@ def edit_venue_submission(venue_id):
   venue.address=request.form['address']
   venue.phone=request.form['phone']
   venue.image_link=request.form['image_link']
-  venue.genres=request.form['genres']
+  venue.genres=genres_named(request.form.getlist('genres'))
   venue.facebook_link=request.form['facebook_link']
   db.session.commit()
   return redirect(url_for('show_venue', venue_id=venue_id))
@@ -456,7 +693,7 @@ def create_artist_submission():
   # TODO: modify data to be the data object returned from db insertion
   error = False
   try:
-    artist = Artist(name=request.form['name'], city=request.form['city'], state=request.form['state'], phone=request.form['phone'], genres=request.form['genres'], image_link=request.form['image_link'], facebook_link=request.form['facebook_link'])
+    artist = Artist(name=request.form['name'], city=request.form['city'], state=request.form['state'], phone=request.form['phone'], genres=genres_named(request.form.getlist('genres')), image_link=request.form['image_link'], facebook_link=request.form['facebook_link'])
     db.session.add(artist)
     db.session.commit()
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
@@ -518,8 +755,65 @@ def shows():
   #   "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
   #   "start_time": "2035-04-15T20:00:00.000Z"
   # }]
-  data = db.session.query(Show, Venue, Artist).with_entities(Venue.id.label('venue_id'), Venue.name.label('venue_name'), Artist.id.label('artist_id'), Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), Show.start_time.label('start_time')).filter(Show.venue_id == Venue.id, Show.artist_id == Artist.id).all()
-  return render_template('pages/shows.html', shows=data)
+  # one window of shows per page, upcoming only unless a from date is given,
+  # streamed so the page starts rendering before the rows are fetched
+  try:
+    start = dateutil.parser.parse(request.args['from']) if request.args.get('from') else datetime.now()
+    end = parse_window_end(request.args['to']) if request.args.get('to') else None
+    after = None
+    if request.args.get('after'):
+      after = (dateutil.parser.parse(request.args['after']), request.args.get('after_id', 0, type=int))
+  except (ValueError, OverflowError):
+    abort(400)
+  page = ShowsPage(shows_query(start, end, after), SHOWS_PER_PAGE)
+  window = {key: request.args[key] for key in ['from', 'to'] if request.args.get(key)}
+  return Response(stream_with_context(stream_template('pages/shows.html', shows=page, window=window)))
+
+def parse_window_end(value):
+  # the exclusive end of the shows window: a date without a time is parsed as its midnight,
+  # which would leave the day itself out, so it ends at the start of the next day instead.
+  # the time was given when parsing against two default times gives the same result
+  midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+  end = dateutil.parser.parse(value, default=midnight)
+  if end != dateutil.parser.parse(value, default=midnight.replace(hour=1)):
+    end += timedelta(days=1)
+  return end
+
+def shows_query(start, end=None, after=None):
+  # shows starting from start and before end, ordered by time, read through the
+  # start_time index. after is the (start_time, id) of the last show of the previous page,
+  # the keyset condition keeps the start_time >= bound so the index range is narrowed too
+  query = db.session.query(Show.id, Venue.id.label('venue_id'), Venue.name.label('venue_name'), Artist.id.label('artist_id'), Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), Show.start_time).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).filter(Show.start_time >= start)
+  if end is not None:
+    query = query.filter(Show.start_time < end)
+  if after is not None:
+    after_time, after_id = after
+    query = query.filter(Show.start_time >= after_time, or_(Show.start_time > after_time, Show.id > after_id))
+  return query.order_by(Show.start_time, Show.id)
+
+class ShowsPage(object):
+  # iterates one page of the query lazily, one row past the page tells whether there
+  # is a next page, whose keyset is then in next_after once the page was iterated
+  def __init__(self, query, per_page):
+    self.query = query
+    self.per_page = per_page
+    self.next_after = None
+
+  def __iter__(self):
+    last = None
+    for index, show in enumerate(self.query.limit(self.per_page + 1)):
+      if index == self.per_page:
+        self.next_after = {'after': last.start_time.isoformat(), 'after_id': last.id}
+        break
+      last = show
+      yield show
+
+def stream_template(template_name, **context):
+  # render_template as a generator of chunks, as flask.stream_template does in Flask 2.2
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(5)
+  return stream
 
 @app.route('/shows/create')
 def create_shows():
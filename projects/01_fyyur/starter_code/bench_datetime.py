@@ -0,0 +1,65 @@
+import sys
+import random
+import timeit
+import argparse
+import dateutil.parser
+import babel.dates
+from datetime import datetime, timedelta
+
+from app import format_datetime, DATETIME_FORMATS
+
+'''
+Micro-benchmark of the datetime template filter
+
+  python bench_datetime.py [--rows 1000] [--distinct 100] [--repeat 5]
+
+  formats --rows start times drawn from --distinct timestamps, as one /shows page render does,
+  with the old per-call parse and pattern build and with format_datetime, and prints the best
+  time per call of --repeat runs
+'''
+
+def uncached_format_datetime(value, format='medium'):
+  # the filter before the pattern and output caches: parse and build the pattern every call
+  date = dateutil.parser.parse(value)
+  return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format))
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='datetime filter micro-benchmark')
+  parser.add_argument('--rows', type=int, default=1000, help='values formatted per run')
+  parser.add_argument('--distinct', type=int, default=100, help='distinct timestamps among the values')
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args(argv)
+
+  start = datetime(2035, 4, 1, 20, 0)
+  stamps = [start + timedelta(hours=index) for index in range(args.distinct)]
+  values = [random.choice(stamps) for _ in range(args.rows)]
+  strings = [value.isoformat() for value in values]
+
+  def cold(formatter, inputs):
+    # every timestamp seen for the first time, the compiled pattern is kept
+    def run():
+      format_datetime.cache_clear()
+      for value in inputs:
+        formatter(value, 'full')
+    return run
+
+  def warm(formatter, inputs):
+    def run():
+      for value in inputs:
+        formatter(value, 'full')
+    return run
+
+  cases = [
+    ('uncached, strings', warm(uncached_format_datetime, strings)),
+    ('cached, strings, cold', cold(format_datetime, strings)),
+    ('cached, datetimes, cold', cold(format_datetime, values)),
+    ('cached, datetimes, warm', warm(format_datetime, values)),
+  ]
+  for name, run in cases:
+    run()
+    best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+    sys.stdout.write('{:<26} {:8.2f} us per call\n'.format(name, best / args.rows * 1e6))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,85 @@
+"""genre table with venue and artist associations
+
+Revision ID: 2a7998adc00e
+Revises: 8bb57318c1ea
+Create Date: 2026-10-18 12:31:40.382215
+
+"""
+import csv
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a7998adc00e'
+down_revision = '8bb57318c1ea'
+branch_labels = None
+depends_on = None
+
+
+def parse_genres(value):
+    # the old column holds array literals from the multi-select, {Jazz,"Rock n Roll"},
+    # and hand written lists, Classical, R&B
+    value = (value or '').strip()
+    if value.startswith('{') and value.endswith('}'):
+        value = value[1:-1]
+    names = next(csv.reader([value], skipinitialspace=True), [])
+    return [name.strip() for name in names if name.strip()]
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('VenueGenre',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_VenueGenre_genre_id_venue_id', 'VenueGenre', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('ArtistGenre',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_ArtistGenre_genre_id_artist_id', 'ArtistGenre', ['genre_id', 'artist_id'], unique=False)
+
+    # backfill from the genre strings, then drop them
+    connection = op.get_bind()
+    parsed = {}
+    for table in ['Venue', 'Artist']:
+        rows = connection.execute(sa.text('SELECT id, genres FROM "{}"'.format(table)))
+        parsed[table] = [(row.id, parse_genres(row.genres)) for row in rows]
+    names = sorted(set(name for rows in parsed.values() for _, genres in rows for name in genres))
+    ids = {name: index for index, name in enumerate(names, 1)}
+    op.bulk_insert(genre, [{'id': ids[name], 'name': name} for name in names])
+    if names:
+        op.execute('SELECT setval(pg_get_serial_sequence(\'"Genre"\', \'id\'), {})'.format(len(names)))
+    for table, association, fk in [('Venue', 'VenueGenre', 'venue_id'), ('Artist', 'ArtistGenre', 'artist_id')]:
+        rows = [{fk: id, 'genre_id': ids[name]} for id, genres in parsed[table] for name in set(genres)]
+        op.bulk_insert(sa.table(association, sa.column(fk, sa.Integer), sa.column('genre_id', sa.Integer)), rows)
+        op.drop_column(table, 'genres')
+
+
+def downgrade():
+    for table, association, fk in [('Artist', 'ArtistGenre', 'artist_id'), ('Venue', 'VenueGenre', 'venue_id')]:
+        op.add_column(table, sa.Column('genres', sa.String(length=120), nullable=True))
+        # back to array literals, the format the multi-select wrote, cut to the old column size
+        op.execute(
+            'UPDATE "{0}" SET genres = ('
+            'SELECT left(\'{{\' || string_agg(\'"\' || "Genre".name || \'"\', \',\' ORDER BY "Genre".name) || \'}}\', 120) '
+            'FROM "{1}" JOIN "Genre" ON "Genre".id = "{1}".genre_id WHERE "{1}".{2} = "{0}".id)'
+            .format(table, association, fk))
+    op.drop_index('ix_ArtistGenre_genre_id_artist_id', table_name='ArtistGenre')
+    op.drop_table('ArtistGenre')
+    op.drop_index('ix_VenueGenre_genre_id_venue_id', table_name='VenueGenre')
+    op.drop_table('VenueGenre')
+    op.drop_table('Genre')
@@ -0,0 +1,46 @@
+"""upcoming and past show counters on venues and artists
+
+Revision ID: 54433b78bd61
+Revises: 8fff4f26bfb6
+Create Date: 2026-10-18 11:02:17.604211
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '54433b78bd61'
+down_revision = '8fff4f26bfb6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ['Venue', 'Artist']:
+        op.add_column(table, sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    rollover = op.create_table('ShowCounterRollover',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # backfill against the rollover timestamp, the app counts with the same local time
+    now = datetime.now()
+    op.bulk_insert(rollover, [{'id': 1, 'rolled_at': now}])
+    for table, show_fk in [('Venue', 'venue_id'), ('Artist', 'artist_id')]:
+        op.get_bind().execute(sa.text(
+            'UPDATE "{0}" SET '
+            'num_upcoming_shows = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id AND "Show".start_time > :now), '
+            'num_past_shows = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id AND "Show".start_time <= :now)'
+            .format(table, show_fk)), now=now)
+
+
+def downgrade():
+    op.drop_table('ShowCounterRollover')
+    for table in ['Artist', 'Venue']:
+        op.drop_column(table, 'num_past_shows')
+        op.drop_column(table, 'num_upcoming_shows')
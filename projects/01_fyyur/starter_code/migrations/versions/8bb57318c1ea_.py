@@ -0,0 +1,38 @@
+"""surrogate key and start_time indexes for shows
+
+Revision ID: 8bb57318c1ea
+Revises: 54433b78bd61
+Create Date: 2026-10-18 11:48:05.129870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8bb57318c1ea'
+down_revision = '54433b78bd61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # serial numbers the existing rows
+    op.execute('ALTER TABLE "Show" ADD COLUMN id SERIAL')
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.create_primary_key('Show_pkey', 'Show', ['id'])
+    # the old primary key stays as the uniqueness rule
+    op.create_unique_constraint('uq_Show_artist_id_venue_id_start_time', 'Show', ['artist_id', 'venue_id', 'start_time'])
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'])
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_constraint('uq_Show_artist_id_venue_id_start_time', 'Show', type_='unique')
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.drop_column('Show', 'id')
+    op.create_primary_key('Show_pkey', 'Show', ['artist_id', 'venue_id', 'start_time'])
@@ -0,0 +1,384 @@
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import contextlib
+from sqlalchemy.engine.url import make_url
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+import search
+from models import format_question, question_query, question_ids_query, question_counts_query, categories_query, search_index_query
+from fsnd_shared.engine_config import engine_options, statement_timeout
+from flaskr import QUESTIONS_PER_PAGE, QUIZ_SAMPLE_ATTEMPTS, questions_page_query, questions_page
+
+'''
+Async application mode
+  the trivia API as an ASGI application, same routes and response shapes as flaskr.create_app()
+  queries run on asyncpg (postgresql) or aiosqlite (sqlite) so a worker serves many requests
+  while waiting on the database, see requirements-async.txt
+
+  uvicorn async_app:app --workers 4
+
+  the schema is the one created by the sync app (setup_db) or trivia.psql
+  the reads are the statements of models, flaskr and search, compiled for the driver
+'''
+
+QUESTION_COLUMNS = 'id, question, answer, category, difficulty'
+
+# positional placeholders: $1, $2, ... for asyncpg (rendered :1 and rewritten), ? for sqlite
+DIALECTS = {
+  'postgresql': postgresql.dialect(paramstyle='numeric'),
+  'sqlite': sqlite.dialect(paramstyle='qmark'),
+}
+
+'''
+AsyncDatabase(database_path)
+  a connection pool on the async driver of the database url
+  fetch() runs SQLAlchemy statements or sql text with postgresql placeholders ($1, $2, ...),
+  the text is rewritten for sqlite; write() runs a statement that changes data and commits it
+  DB_STATEMENT_TIMEOUT applies to the postgresql connections as in engine_options()
+'''
+class AsyncDatabase:
+  def __init__(self, database_path):
+    self.url = make_url(database_path)
+    self.dialect = self.url.get_backend_name()
+    self._pool = None
+    self._connection = None
+
+  async def connect(self):
+    if self.dialect == 'postgresql':
+      import asyncpg
+      options = engine_options(str(self.url))
+      timeout = statement_timeout(str(self.url))
+      self._pool = await asyncpg.create_pool(
+        user=self.url.username, password=self.url.password, host=self.url.host,
+        port=self.url.port, database=self.url.database,
+        min_size=1, max_size=options.get('pool_size', 5) + options.get('max_overflow', 10),
+        server_settings={} if timeout is None else {'statement_timeout': str(timeout)})
+    elif self.dialect == 'sqlite':
+      import aiosqlite
+      self._connection = await aiosqlite.connect(self.url.database)
+    else:
+      raise ValueError('no async driver for ' + self.dialect)
+
+  async def close(self):
+    if self._pool is not None:
+      await self._pool.close()
+    if self._connection is not None:
+      await self._connection.close()
+
+  def compile(self, statement, args):
+    if isinstance(statement, str):
+      if self._pool is not None:
+        return statement, args
+      return re.sub(r'\$(\d+)', r'?\1', statement), args
+    compiled = statement.compile(dialect=DIALECTS[self.dialect])
+    args = tuple(compiled.params[name] for name in compiled.positiontup)
+    if self._pool is not None:
+      return re.sub(r'(?<![:\w]):(\d+)', r'$\1', str(compiled)), args
+    return str(compiled), args
+
+  async def fetch(self, statement, *args):
+    sql, args = self.compile(statement, args)
+    if self._pool is not None:
+      async with self._pool.acquire() as connection:
+        return [tuple(row) for row in await connection.fetch(sql, *args)]
+    # reads open no transaction on sqlite, there is nothing to commit
+    async with self._connection.execute(sql, args) as cursor:
+      return await cursor.fetchall()
+
+  async def fetchrow(self, statement, *args):
+    rows = await self.fetch(statement, *args)
+    return rows[0] if rows else None
+
+  async def scalar(self, statement, *args):
+    row = await self.fetchrow(statement, *args)
+    return row[0] if row else None
+
+  async def write(self, statement, *args):
+    # one statement in its own transaction, returns the first row it returns
+    sql, args = self.compile(statement, args)
+    if self._pool is not None:
+      async with self._pool.acquire() as connection:
+        row = await connection.fetchrow(sql, *args)
+      return tuple(row) if row is not None else None
+    async with self._connection.execute(sql, args) as cursor:
+      rows = await cursor.fetchall()
+    await self._connection.commit()
+    return rows[0] if rows else None
+
+'''
+AsyncTtlCache(ttl)
+  the async counterpart of the question_counts, question_ids and category_cache caches,
+  values are loaded once per key and ttl, writes made through this app invalidate them
+'''
+class AsyncTtlCache:
+  def __init__(self, ttl):
+    self.ttl = ttl
+    self._entries = {}
+    self._lock = asyncio.Lock()
+
+  async def get(self, key, loader):
+    entry = self._entries.get(key)
+    if entry is None or time.monotonic() - entry[0] > self.ttl:
+      async with self._lock:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+          entry = (time.monotonic(), await loader())
+          self._entries[key] = entry
+    return entry[1]
+
+  def invalidate(self):
+    self._entries = {}
+
+def error(status, message):
+  return JSONResponse({
+    'success': False,
+    'error': status,
+    'message': message
+  }, status_code=status)
+
+ERROR_MESSAGES = {
+  400: 'bad request',
+  404: 'resource not found',
+  422: 'unprocessable',
+  500: 'Internal Server Error',
+}
+
+def create_async_app(database_path=None):
+  database = AsyncDatabase(database_path or models.database_path)
+  counts = AsyncTtlCache(ttl=60)
+  ids = AsyncTtlCache(ttl=60)
+  categories = AsyncTtlCache(ttl=300)
+  search_indexes = AsyncTtlCache(ttl=300)
+
+  def invalidate_questions():
+    counts.invalidate()
+    ids.invalidate()
+
+  async def load_counts():
+    rows = await database.fetch(question_counts_query())
+    by_category = {category_id: count for category_id, count in rows if category_id is not None}
+    return sum(count for _, count in rows), by_category
+
+  async def total_questions(category_id=None):
+    total, by_category = await counts.get('counts', load_counts)
+    return total if category_id is None else by_category.get(category_id, 0)
+
+  async def question_ids(category_id=None):
+    async def load():
+      return tuple(question_id for question_id, in await database.fetch(question_ids_query(category_id)))
+    return await ids.get(category_id, load)
+
+  async def search_index_exists():
+    async def load():
+      query = search_index_query(database.dialect)
+      return query is not None and await database.fetchrow(query) is not None
+    return await search_indexes.get('exists', load)
+
+  async def category_list():
+    async def load():
+      return [[type] for type, in await database.fetch(categories_query())]
+    return await categories.get('categories', load)
+
+  '''
+  paginate_questions(request, category_id)
+    same paging as the sync app, ?page=n or ?cursor=<next_cursor>, on flaskr.questions_page_query()
+  '''
+  async def paginate_questions(request, category_id=None):
+    after = None
+    cursor = request.query_params.get('cursor')
+    if cursor is not None:
+      try:
+        after = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))['after'])
+      except Exception:
+        raise HTTPException(400)
+    try:
+      page = max(int(request.query_params.get('page', 1)), 1)
+    except ValueError:
+      page = 1
+    return questions_page(await database.fetch(questions_page_query(category_id, after, page)))
+
+  '''
+  search_questions(term, page)
+    search.search_questions() with the statements of the search module
+  '''
+  async def search_questions(term, page):
+    if not term.strip():
+      return [], 0
+    indexed = await search_index_exists()
+    check = search.tsquery_check(term, database.dialect) if indexed else None
+    query = search.search_query(term, database.dialect, indexed and (check is None or bool(await database.scalar(check))))
+    rows = await database.fetch(search.search_page(query, page, QUESTIONS_PER_PAGE))
+    if not rows:
+      return [], 0 if page == 1 else await database.scalar(search.search_count(query))
+    return [format_question(row) for row in rows], rows[0][5]
+
+  async def retrieve_categories(request):
+    types = await category_list()
+    return JSONResponse({
+      'success': True,
+      'categories': types,
+      'total_categories': len(types)
+    })
+
+  async def get_questions(request):
+    formatted_questions, next_cursor = await paginate_questions(request)
+    return JSONResponse({
+      'success': True,
+      'questions': formatted_questions,
+      'total_questions': await total_questions(),
+      'next_cursor': next_cursor,
+      'categories': await category_list()
+    })
+
+  async def get_question(request):
+    row = await database.fetchrow(question_query(request.path_params['question_id']))
+    if row is None:
+      raise HTTPException(404)
+    return JSONResponse({
+      'success': True,
+      'question': format_question(row)
+    })
+
+  async def delete_question(request):
+    question_id = request.path_params['question_id']
+    row = await database.write('DELETE FROM questions WHERE id = $1 RETURNING id', question_id)
+    if row is None:
+      raise HTTPException(404)
+    invalidate_questions()
+    return JSONResponse({
+      'success': True,
+      'deleted_question_id': question_id
+    })
+
+  async def search_post_questions(request):
+    try:
+      body = await request.json()
+      search = body.get('searchTerm', None)
+      if search:
+        page = max(int(body.get('page', 1)), 1)
+        formatted_questions, total = await search_questions(search, page)
+        return JSONResponse({
+          'success': True,
+          'questions': formatted_questions,
+          'total_questions': total
+        })
+      values = [body.get(name) for name in ('question', 'answer', 'category', 'difficulty')]
+      if any(value is None for value in values):
+        raise HTTPException(400)
+      question, answer, category, difficulty = values
+      row = await database.write(
+        'INSERT INTO questions (question, answer, category, difficulty) VALUES ($1, $2, $3, $4) RETURNING ' + QUESTION_COLUMNS,
+        question, answer, int(category) + 1, int(difficulty))
+    except Exception:
+      raise HTTPException(422)
+    invalidate_questions()
+    return JSONResponse({
+      'success': True,
+      'created': row[0],
+      'question': format_question(row),
+      'total_questions': await total_questions()
+    }, status_code=201, headers={'Location': '/questions/{}'.format(row[0])})
+
+  async def get_category_questions(request):
+    category_id = request.path_params['category_id'] + 1
+    formatted_questions, next_cursor = await paginate_questions(request, category_id)
+    return JSONResponse({
+      'success': True,
+      'questions': formatted_questions,
+      'total_questions': await total_questions(category_id),
+      'next_cursor': next_cursor,
+      'categories': await category_list()
+    })
+
+  '''
+  quizzes(request)
+    samples the cached ids like flaskr.pick_quiz_question()
+  '''
+  async def quizzes(request):
+    try:
+      body = await request.json()
+      previous = set(body.get('previous_questions', None))
+      quiz_category = body.get('quiz_category', None)
+      if quiz_category['type'] == 'click':
+        category_id = None
+      else:
+        category_id = int(quiz_category['id']) + 1
+      row = None
+      for attempt in range(2):
+        candidates = await question_ids(category_id)
+        question_id = None
+        for _ in range(QUIZ_SAMPLE_ATTEMPTS if candidates else 0):
+          candidate = random.choice(candidates)
+          if candidate not in previous:
+            question_id = candidate
+            break
+        if question_id is None:
+          remaining = [candidate for candidate in candidates if candidate not in previous]
+          if not remaining:
+            break
+          question_id = random.choice(remaining)
+        row = await database.fetchrow(question_query(question_id))
+        if row is not None:
+          break
+        # deleted by another process since the ids were cached
+        ids.invalidate()
+    except Exception:
+      raise HTTPException(422)
+    if row is None:
+      return JSONResponse({
+        'success': True
+      })
+    return JSONResponse({
+      'success': True,
+      'question': format_question(row),
+      'total_questions': len(candidates)
+    })
+
+  async def http_error(request, exc):
+    if exc.status_code in ERROR_MESSAGES:
+      return error(exc.status_code, ERROR_MESSAGES[exc.status_code])
+    return JSONResponse({'success': False, 'error': exc.status_code}, status_code=exc.status_code)
+
+  async def server_error(request, exc):
+    return error(500, ERROR_MESSAGES[500])
+
+  @contextlib.asynccontextmanager
+  async def lifespan(app):
+    await database.connect()
+    try:
+      yield
+    finally:
+      await database.close()
+
+  app = Starlette(
+    routes=[
+      Route('/categories', retrieve_categories, methods=['GET']),
+      Route('/questions', get_questions, methods=['GET']),
+      Route('/questions', search_post_questions, methods=['POST']),
+      Route('/questions/{question_id:int}', get_question, methods=['GET']),
+      Route('/questions/{question_id:int}', delete_question, methods=['DELETE']),
+      Route('/categories/{category_id:int}/questions', get_category_questions, methods=['GET']),
+      Route('/quizzes', quizzes, methods=['POST']),
+    ],
+    middleware=[
+      Middleware(CORSMiddleware, allow_origins=['*'], allow_headers=['Content-Type', 'Authorization'],
+                 allow_methods=['GET', 'PUT', 'POST', 'DELETE', 'OPTIONS'])
+    ],
+    exception_handlers={HTTPException: http_error, 500: server_error},
+    lifespan=lifespan)
+  app.state.database = database
+  return app
+
+app = create_async_app()
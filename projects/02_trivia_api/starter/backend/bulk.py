@@ -0,0 +1,230 @@
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+from flask import Flask
+
+import models
+from models import setup_db, db, Question, Category
+
+'''
+Bulk import / export of the trivia bank
+
+  python bulk.py import questions.jsonl --table questions [--batch-size 5000] [--database URL]
+  python bulk.py export questions.csv --table questions
+  python bulk.py benchmark --rows 100000
+
+  the format follows the file extension: .jsonl (one json object per line) or .csv
+  records are streamed, inserted per batch with COPY on postgresql and executemany elsewhere,
+  and progress is reported on stderr after every batch
+'''
+
+COLUMNS = {
+  'questions': ['id', 'question', 'answer', 'category', 'difficulty'],
+  'categories': ['id', 'type'],
+}
+TABLES = {
+  'questions': Question.__table__,
+  'categories': Category.__table__,
+}
+INTEGER_COLUMNS = {'id', 'category', 'difficulty'}
+
+def file_format(path):
+  return 'csv' if path.endswith('.csv') else 'jsonl'
+
+def read_records(path, table):
+  with open(path, newline='') as source:
+    if file_format(path) == 'csv':
+      records = csv.DictReader(source)
+    else:
+      records = (json.loads(line) for line in source if line.strip())
+    for record in records:
+      row = {}
+      for name in COLUMNS[table]:
+        value = record.get(name)
+        if value == '' or value is None:
+          # without an id the database assigns one
+          if name != 'id':
+            row[name] = None
+          continue
+        row[name] = int(value) if name in INTEGER_COLUMNS else value
+      yield row
+
+def batches(records, batch_size):
+  batch = []
+  for record in records:
+    batch.append(record)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+class Progress:
+  def __init__(self, verb, out=sys.stderr):
+    self.verb = verb
+    self.out = out
+    self.rows = 0
+    self.started = time.perf_counter()
+
+  def add(self, rows):
+    self.rows += rows
+    self.out.write('\r{} {} rows ({:.0f} rows/s)'.format(self.verb, self.rows, self.rate()))
+    self.out.flush()
+
+  def rate(self):
+    elapsed = time.perf_counter() - self.started
+    return self.rows / elapsed if elapsed else 0.0
+
+  def done(self):
+    self.out.write('\n')
+    return self.rows
+
+'''
+column_groups(table, batch)
+  the records of a batch grouped by the columns they carry, in first seen order,
+  records without an id leave it to the database while others set it
+'''
+def column_groups(table, batch):
+  groups = {}
+  for record in batch:
+    columns = tuple(name for name in COLUMNS[table] if name in record)
+    groups.setdefault(columns, []).append(record)
+  return groups.items()
+
+'''
+copy_batch(connection, table, columns, records)
+  postgresql COPY of records that all carry the given columns
+'''
+def copy_batch(connection, table, columns, records):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for record in records:
+    writer.writerow(['' if record[name] is None else record[name] for name in columns])
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(table, ', '.join(columns)), buffer)
+
+def import_records(path, table, batch_size=5000, out=sys.stderr):
+  progress = Progress('imported', out)
+  use_copy = db.engine.dialect.name == 'postgresql'
+  with db.engine.begin() as connection:
+    for batch in batches(read_records(path, table), batch_size):
+      for columns, records in column_groups(table, batch):
+        if use_copy:
+          copy_batch(connection, table, columns, records)
+        else:
+          connection.execute(TABLES[table].insert(), records)
+      progress.add(len(batch))
+    if use_copy:
+      # explicit ids do not advance the serial sequence
+      connection.execute("SELECT setval(pg_get_serial_sequence('{0}', 'id'), coalesce(max(id), 1)) FROM {0}".format(table))
+  models.question_counts.invalidate()
+  models.question_ids.invalidate()
+  models.category_cache.invalidate()
+  return progress.done()
+
+def export_records(path, table, batch_size=5000, out=sys.stderr):
+  progress = Progress('exported', out)
+  columns = COLUMNS[table]
+  source = TABLES[table]
+  query = db.session.query(*[source.c[name] for name in columns]).order_by(source.c.id).yield_per(batch_size)
+  with open(path, 'w', newline='') as target:
+    writer = None
+    if file_format(path) == 'csv':
+      writer = csv.writer(target)
+      writer.writerow(columns)
+    for batch in batches(query, batch_size):
+      for row in batch:
+        if writer:
+          writer.writerow(row)
+        else:
+          target.write(json.dumps(dict(zip(columns, row))) + '\n')
+      progress.add(len(batch))
+  return progress.done()
+
+CATEGORY_TYPES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+'''
+synthetic_questions(path, rows)
+  writes a jsonl bank of random questions over the six categories and returns path
+'''
+def synthetic_questions(path, rows):
+  with open(path, 'w') as target:
+    for index in range(rows):
+      target.write(json.dumps({
+        'question': 'Benchmark question {} about {}'.format(index, random.choice(['rivers', 'paintings', 'stars', 'kings'])),
+        'answer': 'Answer {}'.format(index),
+        'category': random.randint(1, len(CATEGORY_TYPES)),
+        'difficulty': random.randint(1, 5)
+      }) + '\n')
+  return path
+
+'''
+seed_categories()
+  adds the six categories to an empty categories table
+'''
+def seed_categories():
+  if not Category.query.count():
+    db.session.add_all([Category(type) for type in CATEGORY_TYPES])
+    db.session.commit()
+    models.category_cache.invalidate()
+
+'''
+benchmark(rows, batch_size)
+  imports a synthetic bank into a throwaway sqlite database (or --database),
+  row by row with Question.insert() on a sample and with import_records(),
+  and prints the throughput of both
+'''
+def benchmark(rows, batch_size, sample=1000, out=sys.stdout):
+  path = synthetic_questions(os.path.join(tempfile.mkdtemp(), 'questions.jsonl'), rows)
+
+  started = time.perf_counter()
+  inserted = 0
+  for record in read_records(path, 'questions'):
+    if inserted == sample:
+      break
+    Question(record['question'], record['answer'], record['category'], record['difficulty']).insert()
+    inserted += 1
+  row_by_row = inserted / (time.perf_counter() - started)
+
+  started = time.perf_counter()
+  imported = import_records(path, 'questions', batch_size, out=open(os.devnull, 'w'))
+  bulk = imported / (time.perf_counter() - started)
+  out.write('row by row {:>10.0f} rows/s\n'.format(row_by_row))
+  out.write('bulk       {:>10.0f} rows/s  ({} rows, batches of {})\n'.format(bulk, imported, batch_size))
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='bulk import / export of the trivia bank')
+  parser.add_argument('command', choices=['import', 'export', 'benchmark'])
+  parser.add_argument('path', nargs='?')
+  parser.add_argument('--table', choices=sorted(COLUMNS), default='questions')
+  parser.add_argument('--batch-size', type=int, default=5000)
+  parser.add_argument('--rows', type=int, default=100000, help='benchmark bank size')
+  parser.add_argument('--database', default=None, help='database url, defaults to the app database')
+  args = parser.parse_args(argv)
+
+  database_path = args.database or models.database_path
+  if args.command == 'benchmark' and not args.database:
+    database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+  elif args.command != 'benchmark' and not args.path:
+    parser.error('path is required for ' + args.command)
+
+  app = Flask(__name__)
+  setup_db(app, database_path)
+  with app.app_context():
+    if args.command == 'benchmark':
+      seed_categories()
+      benchmark(args.rows, args.batch_size)
+    elif args.command == 'import':
+      import_records(args.path, args.table, args.batch_size)
+    else:
+      export_records(args.path, args.table, args.batch_size)
+
+if __name__ == '__main__':
+  main()
@@ -1,17 +1,107 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import select
 import random
+import json
+import base64
 
-from models import setup_db, Question, Category
+from models import setup_db, create_search_index, database_path, db, Question, question_counts, question_ids, category_cache, question_columns, format_question
+from search import search_questions
 
 QUESTIONS_PER_PAGE = 10
+QUIZ_SAMPLE_ATTEMPTS = 8
 
+'''
+questions_page_query(category_id, after, page)
+  selects one page of the question_columns() of a category (None for all), by id,
+  plus one row that tells whether there is a next page
+  after continues after the last question id seen, otherwise page applies LIMIT/OFFSET
+  shared with the async app
+'''
+def questions_page_query(category_id=None, after=None, page=1):
+  query = select(question_columns())
+  if category_id is not None:
+    query = query.where(Question.category == category_id)
+  if after is not None:
+    query = query.where(Question.id > after)
+  else:
+    query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+  return query.order_by(Question.id).limit(QUESTIONS_PER_PAGE + 1)
+
+'''
+questions_page(rows)
+  the formatted questions of a questions_page_query() result and the next cursor
+'''
+def questions_page(rows):
+  next_cursor = None
+  if len(rows) > QUESTIONS_PER_PAGE:
+    rows = rows[:QUESTIONS_PER_PAGE]
+    next_cursor = encode_cursor(rows[-1][0])
+  return [format_question(row) for row in rows], next_cursor
+
+'''
+paginate_questions(request, category_id)
+  applies the page to the query in SQL and returns the formatted questions and the next cursor
+  ?page=n pages with LIMIT/OFFSET, ?cursor=<next_cursor> continues after the last question id seen
+'''
+def paginate_questions(request, category_id=None):
+  cursor = request.args.get('cursor', None)
+  after = decode_cursor(cursor) if cursor is not None else None
+  page = max(request.args.get('page', 1, type=int), 1)
+  return questions_page(db.session.execute(questions_page_query(category_id, after, page)).fetchall())
+
+'''
+pick_quiz_question(category_id, previous_questions)
+  returns a random question of the category (None for all) that is not in previous_questions,
+  or None when every question was already played, together with the number of questions in the category
+  samples the cached id tuple, a snapshot later writes do not change, which costs O(1) expected while most questions remain,
+  and falls back to a single pass over the remaining ids so it always terminates
+'''
+def pick_quiz_question(category_id, previous_questions):
+  previous = set(previous_questions)
+  for attempt in range(2):
+    ids = question_ids.get(category_id)
+    question_id = None
+    if ids:
+      for _ in range(QUIZ_SAMPLE_ATTEMPTS):
+        candidate = random.choice(ids)
+        if candidate not in previous:
+          question_id = candidate
+          break
+    if question_id is None:
+      remaining = [candidate for candidate in ids if candidate not in previous]
+      if not remaining:
+        return None, len(ids)
+      question_id = random.choice(remaining)
+    question = Question.query.get(question_id)
+    if question is not None:
+      return question, len(ids)
+    # deleted by another process since the ids were cached
+    question_ids.discard(question_id, category_id)
+  return None, len(ids)
+
+def encode_cursor(last_id):
+  return base64.urlsafe_b64encode(json.dumps({'after': last_id}).encode()).decode()
+
+def decode_cursor(cursor):
+  try:
+    return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))['after'])
+  except Exception:
+    abort(400)
+
+'''
+create_app(test_config)
+  test_config is a mapping applied to app.config before the database is set up,
+  its SQLALCHEMY_DATABASE_URI replaces models.database_path, so tests never touch the app database
+'''
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__, instance_relative_config=True)
-  setup_db(app)
+  if test_config is not None:
+    app.config.from_mapping(test_config)
+  setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
 
   '''
   @Done: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -34,13 +124,7 @@ def create_app(test_config=None):
   '''
   @app.route('/categories')
   def retrieve_categories():
-    categories = Category.query.with_entities(Category.type).order_by(Category.id).all()
-    
-    return jsonify({
-      'success': True,
-      'categories': categories,
-      'total_categories': len(categories)
-    })
+    return app.response_class(category_cache.body(), mimetype='application/json')
 
 
   '''
@@ -57,22 +141,30 @@ def create_app(test_config=None):
   '''
   @app.route('/questions',methods=['GET'])
   def get_questions():
-      page = request.args.get('page', 1 ,type = int)
-      start = (page - 1) * QUESTIONS_PER_PAGE
-      end = start + QUESTIONS_PER_PAGE
-      questions = Question.query.order_by(Question.id).all()
-      categories = Category.query.with_entities(Category.type).order_by(Category.id).all()
-      formatted_questions =[]
-      for question in questions:
-        formatted_questions.append(Question.format(question))
-       
+      formatted_questions, next_cursor = paginate_questions(request)
       return jsonify({
           'success': True,
-          'questions': formatted_questions[start:end],
-          'total_questions': len(questions),
-          'categories': categories
+          'questions': formatted_questions,
+          'total_questions': question_counts.total(),
+          'next_cursor': next_cursor,
+          'categories': category_cache.categories()
       })
 
+  '''
+  GET a single question by ID, the Location of a created question
+  '''
+  @app.route('/questions/<int:question_id>',methods=['GET'])
+  def get_question(question_id):
+    question = Question.query.filter(Question.id == question_id).one_or_none()
+
+    if question is None:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'question': question.format()
+    })
+
   '''
   @Done: 
   Create an endpoint to DELETE question using a question ID. 
@@ -126,28 +218,25 @@ def create_app(test_config=None):
       category = body.get('category', None)
       try:
         if search:
-          questions = Question.query.order_by(Question.id).filter(Question.question.ilike('%{}%'.format(search))).all()
-          formatted_questions =[]
-          for question in questions:
-            formatted_questions.append(Question.format(question))
+          page = max(int(body.get('page', 1)), 1)
+          formatted_questions, total_questions = search_questions(search, page, QUESTIONS_PER_PAGE)
           return jsonify({
             'success': True,
             'questions': formatted_questions,
-            'total_questions': len(questions)
+            'total_questions': total_questions
           })
         elif question is not None and answer is not None and difficulty is not None and category is not None:
-          category = str(int(category)+1)
+          category = int(category)+1
           questionObj = Question(question = question, answer = answer, category = category, difficulty = difficulty )
           questionObj.insert()
-          questions = Question.query.order_by(Question.id).all()
-          formatted_questions =[]
-          for question in questions:
-            formatted_questions.append(Question.format(question))
-          return jsonify({
+          response = jsonify({
             'success': True,
-            'questions': formatted_questions,
-            'total_questions': len(questions)
+            'created': questionObj.id,
+            'question': questionObj.format(),
+            'total_questions': question_counts.total()
           })
+          response.headers['Location'] = url_for('get_question', question_id=questionObj.id)
+          return response, 201
         else:
           abort(400)
       except:
@@ -162,20 +251,14 @@ def create_app(test_config=None):
   '''
   @app.route('/categories/<int:category_id>/questions',methods=['GET'])
   def get_category_questions(category_id):
-      page = request.args.get('page', 1 ,type = int)
-      start = (page - 1) * QUESTIONS_PER_PAGE
-      end = start + QUESTIONS_PER_PAGE
-      questions = Question.query.filter(Question.category == str(category_id+1)).order_by(Question.id).all()
-      categories = Category.query.with_entities(Category.type).order_by(Category.id).all()
-      formatted_questions =[]
-      for question in questions:
-        formatted_questions.append(Question.format(question))
-       
+      category_id = category_id + 1
+      formatted_questions, next_cursor = paginate_questions(request, category_id)
       return jsonify({
           'success': True,
-          'questions': formatted_questions[start:end],
-          'total_questions': len(questions),
-          'categories': categories
+          'questions': formatted_questions,
+          'total_questions': question_counts.total(category_id),
+          'next_cursor': next_cursor,
+          'categories': category_cache.categories()
       })
   '''
   @Done: 
@@ -196,38 +279,20 @@ def create_app(test_config=None):
       quiz_category = body.get('quiz_category', None)
       try:
         if quiz_category['type'] =='click':
-          questions = Question.query.order_by(Question.id).all()
-          if len(previous_questions) != len(questions):
-            n = random.randint(0,len(questions)-1)
-            while questions[n].id in previous_questions :
-                n = random.randint(1,len(questions)-1)
-            formatted_question = Question.format(questions[n])
-            return jsonify({
-              'success': True,
-              'question': formatted_question,
-              'total_questions': len(questions)
-            })
-          else:
-            return jsonify({
-              'success': True
-            })
+          category_id = None
         else:
-          category_id = str(int(quiz_category['id'])+1)
-          questions = Question.query.filter(Question.category == category_id).order_by(Question.id).all()
-          if len(previous_questions) != len(questions):
-            n = random.randint(0,len(questions)-1)
-            while questions[n].id in previous_questions :
-                n = random.randint(1,len(questions)-1)
-            formatted_question = Question.format(questions[n])
-            return jsonify({
-              'success': True,
-              'question': formatted_question,
-              'total_questions': len(questions)
-            })
-          else:
-            return jsonify({
-              'success': True
-            })
+          category_id = int(quiz_category['id'])+1
+        question, total_questions = pick_quiz_question(category_id, previous_questions)
+        if question is not None:
+          return jsonify({
+            'success': True,
+            'question': question.format(),
+            'total_questions': total_questions
+          })
+        else:
+          return jsonify({
+            'success': True
+          })
       except:
        abort(422)
   '''
@@ -266,6 +331,11 @@ def create_app(test_config=None):
       "error": 500,
       "message": "Internal Server Error"
       }), 500
+
+  @app.cli.command('create-search-index')
+  def create_search_index_command():
+    '''builds the question search index, run it once before deploying'''
+    create_search_index()
   
   return app
 
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.client
+from flask import Flask
+
+import bulk
+from models import setup_db, create_search_index
+from flaskr import QUESTIONS_PER_PAGE
+
+'''
+Load test and benchmark harness
+
+  python loadtest.py [--rows 10000] [--app sync] [--app async] [--concurrency 32] [--duration 10]
+                     [--workers 1] [--threads 8]
+                     [--database URL [--seed]] [--endpoint quizzes ...]
+                     [--thresholds loadtest_thresholds.json] [--save baseline.json] [--baseline baseline.json]
+
+  seeds a synthetic bank (a throwaway sqlite database unless --database is given, which is only
+  seeded with --seed), serves it with each --app in turn, drives every endpoint with concurrent
+  keep-alive clients and prints requests, req/s and p50/p95/p99 per endpoint
+  both apps run on gunicorn with the same --workers processes, the sync app on threaded workers
+  (--threads per worker), the async app on uvicorn workers, so the comparison is between the
+  request handling and not between two servers (see requirements-loadtest.txt)
+
+  --thresholds fails the run when an endpoint is slower than the ceilings of the file,
+  --save writes the results and --baseline fails the run when p95 grew or req/s dropped by more
+  than --tolerance against a saved run, the exit status is 1 on any failure
+'''
+
+# python -m gunicorn arguments of each app
+SERVERS = {
+  'sync': ['--worker-class', 'gthread', '--threads', '{threads}', 'flaskr:create_app()'],
+  'async': ['--worker-class', 'uvicorn.workers.UvicornWorker', 'async_app:app'],
+}
+
+SEARCH_TERMS = ['rivers', 'paint', 'star', 'kings', 'question 12', 'benchmark about']
+
+def quizzes_request(rows):
+  return 'POST', '/quizzes', {
+    'previous_questions': random.sample(range(1, rows + 1), min(5, rows)),
+    'quiz_category': {'type': 'Science', 'id': random.randint(0, 5)}
+  }
+
+def questions_request(rows):
+  return 'GET', '/questions?page={}'.format(random.randint(1, max(rows // QUESTIONS_PER_PAGE, 1))), None
+
+def category_questions_request(rows):
+  return 'GET', '/categories/{}/questions'.format(random.randint(0, 5)), None
+
+def categories_request(rows):
+  return 'GET', '/categories', None
+
+def search_request(rows):
+  return 'POST', '/questions', {'searchTerm': random.choice(SEARCH_TERMS), 'page': random.randint(1, 3)}
+
+# endpoint name, request factory, weight in the mix, quiz traffic dominates a spike
+ENDPOINTS = [
+  ('quizzes', quizzes_request, 5),
+  ('questions', questions_request, 2),
+  ('category_questions', category_questions_request, 1),
+  ('search', search_request, 1),
+  ('categories', categories_request, 1),
+]
+
+def seed(database_path, rows):
+  app = Flask(__name__)
+  setup_db(app, database_path)
+  with app.app_context():
+    bulk.seed_categories()
+    path = bulk.synthetic_questions(os.path.join(tempfile.mkdtemp(), 'questions.jsonl'), rows)
+    bulk.import_records(path, 'questions')
+    create_search_index()
+
+def start_server(app, port, database_path, workers, threads):
+  environ = dict(os.environ, DATABASE_URL=database_path)
+  arguments = [argument.format(threads=threads) for argument in SERVERS[app]]
+  process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--bind', '127.0.0.1:{}'.format(port),
+                              '--workers', str(workers), '--log-level', 'warning'] + arguments,
+                             env=environ, cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  deadline = time.monotonic() + 30
+  while time.monotonic() < deadline:
+    try:
+      connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+      connection.request('GET', '/categories')
+      if connection.getresponse().status == 200:
+        return process
+    except OSError:
+      time.sleep(0.2)
+  process.kill()
+  raise RuntimeError('{} server did not start'.format(app))
+
+'''
+drive(port, endpoints, concurrency, duration, rows)
+  runs concurrency clients for duration seconds, each picking requests from the weighted endpoints
+  returns the latencies (seconds) and error counts per endpoint name, and the elapsed time
+'''
+def drive(port, endpoints, concurrency, duration, rows):
+  names, factories, weights = zip(*endpoints)
+  latencies = {name: [] for name in names}
+  errors = {name: 0 for name in names}
+  lock = threading.Lock()
+  deadline = time.monotonic() + duration
+
+  def client():
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    samples = []
+    failed = []
+    while time.monotonic() < deadline:
+      index = random.choices(range(len(names)), weights=weights)[0]
+      method, path, body = factories[index](rows)
+      started = time.perf_counter()
+      try:
+        if body is None:
+          connection.request(method, path)
+        else:
+          connection.request(method, path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+      except (OSError, http.client.HTTPException):
+        failed.append(names[index])
+        connection.close()
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        continue
+      if response.status != 200:
+        failed.append(names[index])
+      samples.append((names[index], time.perf_counter() - started))
+    with lock:
+      for name, latency in samples:
+        latencies[name].append(latency)
+      for name in failed:
+        errors[name] += 1
+
+  threads = [threading.Thread(target=client) for _ in range(concurrency)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return latencies, errors, time.perf_counter() - started
+
+'''
+summarize(latencies, errors, elapsed)
+  requests, req/s, p50/p95/p99 (ms) and errors per endpoint, and over every endpoint as 'all'
+'''
+def summarize(latencies, errors, elapsed):
+  latencies = dict(latencies, all=[latency for samples in latencies.values() for latency in samples])
+  errors = dict(errors, all=sum(errors.values()))
+  summary = {}
+  for name, samples in latencies.items():
+    result = {'requests': len(samples), 'rps': len(samples) / elapsed, 'errors': errors[name]}
+    if len(samples) >= 2:
+      cuts = statistics.quantiles(samples, n=100)
+      result.update(p50=cuts[49] * 1000, p95=cuts[94] * 1000, p99=cuts[98] * 1000)
+    summary[name] = result
+  return summary
+
+def report(app, summary, out=sys.stdout):
+  for name, result in summary.items():
+    if 'p50' not in result:
+      out.write('{:<6} {:<20} {:>8} requests, {} errors\n'.format(app, name, result['requests'], result['errors']))
+      continue
+    out.write('{:<6} {:<20} {:>8} requests {:>8.0f} req/s  p50 {:7.1f} ms  p95 {:7.1f} ms  p99 {:7.1f} ms  {} errors\n'.format(
+      app, name, result['requests'], result['rps'], result['p50'], result['p95'], result['p99'], result['errors']))
+
+'''
+check_thresholds(results, thresholds)
+  thresholds: {endpoint: {'p50': ms, 'p95': ms, 'p99': ms, 'min_rps': req/s, 'max_errors': n}}
+  returns the failures as messages
+'''
+def check_thresholds(results, thresholds):
+  failures = []
+  for app, summary in results.items():
+    for name, limits in thresholds.items():
+      result = summary.get(name)
+      if result is None:
+        continue
+      for percentile in ['p50', 'p95', 'p99']:
+        if percentile in limits and result.get(percentile, float('inf')) > limits[percentile]:
+          failures.append('{} {} {} {:.1f} ms above {} ms'.format(app, name, percentile, result.get(percentile, float('inf')), limits[percentile]))
+      if 'min_rps' in limits and result['rps'] < limits['min_rps']:
+        failures.append('{} {} {:.0f} req/s below {} req/s'.format(app, name, result['rps'], limits['min_rps']))
+      if result['errors'] > limits.get('max_errors', 0):
+        failures.append('{} {} {} errors'.format(app, name, result['errors']))
+  return failures
+
+'''
+check_baseline(results, baseline, tolerance)
+  compares with a run saved by --save, p95 may grow and req/s may drop by tolerance (a fraction)
+  returns the regressions as messages
+'''
+def check_baseline(results, baseline, tolerance):
+  failures = []
+  for app, summary in results.items():
+    for name, result in summary.items():
+      previous = baseline.get(app, {}).get(name)
+      if previous is None or 'p95' not in previous or 'p95' not in result:
+        continue
+      if result['p95'] > previous['p95'] * (1 + tolerance):
+        failures.append('{} {} p95 {:.1f} ms, baseline {:.1f} ms'.format(app, name, result['p95'], previous['p95']))
+      if result['rps'] < previous['rps'] * (1 - tolerance):
+        failures.append('{} {} {:.0f} req/s, baseline {:.0f} req/s'.format(app, name, result['rps'], previous['rps']))
+  return failures
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='trivia api load test')
+  parser.add_argument('--app', action='append', choices=sorted(SERVERS), help='app to serve, repeat to compare (default sync)')
+  parser.add_argument('--endpoint', action='append', choices=[name for name, _, _ in ENDPOINTS], help='endpoint to drive, repeat for several (default all)')
+  parser.add_argument('--rows', type=int, default=10000, help='size of the seeded bank')
+  parser.add_argument('--database', default=None, help='database url, a throwaway sqlite database by default')
+  parser.add_argument('--seed', action='store_true', help='seed --database with --rows questions first')
+  parser.add_argument('--concurrency', type=int, default=32)
+  parser.add_argument('--duration', type=float, default=10)
+  parser.add_argument('--warmup', type=float, default=2, help='seconds driven before measuring')
+  parser.add_argument('--workers', type=int, default=1, help='server processes of either app')
+  parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker of the sync app')
+  parser.add_argument('--port', type=int, default=5055)
+  parser.add_argument('--thresholds', default=None, help='json file of latency ceilings per endpoint')
+  parser.add_argument('--baseline', default=None, help='json file saved by --save to compare against')
+  parser.add_argument('--tolerance', type=float, default=0.2)
+  parser.add_argument('--save', default=None, help='write the results to this json file')
+  args = parser.parse_args(argv)
+
+  database_path = args.database
+  if database_path is None:
+    database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+  if args.database is None or args.seed:
+    seed(database_path, args.rows)
+
+  endpoints = [endpoint for endpoint in ENDPOINTS if not args.endpoint or endpoint[0] in args.endpoint]
+  results = {}
+  for app in args.app or ['sync']:
+    process = start_server(app, args.port, database_path, args.workers, args.threads)
+    try:
+      if args.warmup:
+        drive(args.port, endpoints, args.concurrency, args.warmup, args.rows)
+      results[app] = summarize(*drive(args.port, endpoints, args.concurrency, args.duration, args.rows))
+    finally:
+      process.terminate()
+      process.wait()
+    report(app, results[app])
+
+  if args.save:
+    with open(args.save, 'w') as target:
+      json.dump(results, target, indent=2)
+  failures = []
+  if args.thresholds:
+    with open(args.thresholds) as source:
+      failures += check_thresholds(results, json.load(source))
+  if args.baseline:
+    with open(args.baseline) as source:
+      failures += check_baseline(results, json.load(source), args.tolerance)
+  for failure in failures:
+    sys.stderr.write('FAIL ' + failure + '\n')
+  return 1 if failures else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,10 +1,16 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, func, text, inspect, select
+from sqlalchemy.orm import column_property
 from flask_sqlalchemy import SQLAlchemy
 import json
+from fsnd_shared.engine_config import engine_options, pool_metrics, add_pool_health_route
+from fsnd_shared.shared_version import SharedVersion, redis_backend
+import time
+import bisect
+import threading
 
 database_name = "trivia"
-database_path = "postgresql://{}/{}".format('postgres:postgresql@localhost:5432', database_name)
+database_path = os.environ.get('DATABASE_URL', "postgresql://{}/{}".format('postgres:postgresql@localhost:5432', database_name))
 
 db = SQLAlchemy()
 
@@ -15,9 +21,251 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
   app.config["SQLALCHEMY_DATABASE_URI"] = database_path
   app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+  app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
   db.app = app
   db.init_app(app)
+  pool_metrics.attach(db.get_engine(app))
+  add_pool_health_route(app)
   db.create_all()
+  question_counts.invalidate()
+  question_ids.invalidate()
+  category_cache.invalidate()
+  search_index.invalidate()
+
+'''
+Question search index
+  PostgreSQL: questions.search_vector is a generated tsvector column with a GIN index
+  SQLite: questions_fts is an FTS5 table kept in sync with questions by triggers
+  built once by `flask create-search-index`, not by setup_db: adding the column rewrites the table,
+  until then search_index.exists() is False and the search falls back to a substring match
+'''
+POSTGRES_SEARCH_COLUMN = (
+  "ALTER TABLE questions ADD COLUMN search_vector tsvector "
+  "GENERATED ALWAYS AS (to_tsvector('english', coalesce(question, ''))) STORED")
+
+POSTGRES_SEARCH_INDEX = "CREATE INDEX CONCURRENTLY questions_search_idx ON questions USING gin (search_vector)"
+
+SQLITE_SEARCH_INDEX = [
+  "CREATE VIRTUAL TABLE questions_fts USING fts5(question, content='questions', content_rowid='id')",
+  "CREATE TRIGGER questions_fts_insert AFTER INSERT ON questions BEGIN "
+  "INSERT INTO questions_fts(rowid, question) VALUES (new.id, new.question); END",
+  "CREATE TRIGGER questions_fts_delete AFTER DELETE ON questions BEGIN "
+  "INSERT INTO questions_fts(questions_fts, rowid, question) VALUES ('delete', old.id, old.question); END",
+  "CREATE TRIGGER questions_fts_update AFTER UPDATE ON questions BEGIN "
+  "INSERT INTO questions_fts(questions_fts, rowid, question) VALUES ('delete', old.id, old.question); "
+  "INSERT INTO questions_fts(rowid, question) VALUES (new.id, new.question); END",
+  "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')",
+]
+
+'''
+create_search_index()
+  builds whatever part of the search column/table and its index is missing,
+  only reads the catalog when everything exists
+  on PostgreSQL the index is built concurrently, outside a transaction, so questions stay writable
+'''
+def create_search_index():
+  # on the engine rather than db.session, whose bind may predate the last setup_db() call
+  dialect = db.engine.dialect.name
+  if dialect == 'postgresql':
+    with db.engine.connect() as connection:
+      connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+      column = connection.execute(search_index_query(dialect)).first()
+      if column is None:
+        connection.execute(text(POSTGRES_SEARCH_COLUMN))
+      index = connection.execute(text(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('questions_search_idx')")).first()
+      if index is not None and not index.indisvalid:
+        # left behind by an interrupted concurrent build
+        connection.execute(text("DROP INDEX CONCURRENTLY questions_search_idx"))
+      if index is None or not index.indisvalid:
+        connection.execute(text(POSTGRES_SEARCH_INDEX))
+  elif dialect == 'sqlite':
+    with db.engine.begin() as connection:
+      exists = connection.execute(search_index_query(dialect)).first()
+      if not exists:
+        for statement in SQLITE_SEARCH_INDEX:
+          connection.execute(text(statement))
+  search_index.invalidate()
+
+'''
+search_index_query(dialect)
+  selects a row when the search column (PostgreSQL) or the fts table (SQLite) exists,
+  None for databases without a search index
+'''
+def search_index_query(dialect):
+  if dialect == 'postgresql':
+    return text(
+      "SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() "
+      "AND table_name = 'questions' AND column_name = 'search_vector'")
+  if dialect == 'sqlite':
+    return text("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'")
+  return None
+
+'''
+SearchIndex
+    process-wide answer to whether create_search_index() has run, read from the catalog once
+    a missing index is looked up again after the ttl, so the search picks up an index built
+    while the app is running, setup_db() and create_search_index() reset it
+'''
+class SearchIndex:
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self._exists = None
+    self._checked_at = 0
+    self._lock = threading.Lock()
+
+  def exists(self):
+    with self._lock:
+      if self._exists is None or (not self._exists and time.monotonic() - self._checked_at > self.ttl):
+        query = search_index_query(db.engine.dialect.name)
+        self._exists = query is not None and db.session.execute(query).first() is not None
+        self._checked_at = time.monotonic()
+      return self._exists
+
+  def invalidate(self):
+    with self._lock:
+      self._exists = None
+
+search_index = SearchIndex()
+
+'''
+QuestionCounts
+    process-wide cache of question totals, overall and per category
+    Question.insert(), update() and delete() keep it current for this process,
+    the ttl bounds how stale it can get when other processes write
+'''
+class QuestionCounts:
+  def __init__(self, ttl=60):
+    self.ttl = ttl
+    self._total = None
+    self._by_category = {}
+    self._loaded_at = 0
+    self._lock = threading.Lock()
+
+  def total(self, category_id=None):
+    with self._lock:
+      if self._total is None or time.monotonic() - self._loaded_at > self.ttl:
+        self._load()
+      if category_id is None:
+        return self._total
+      return self._by_category.get(category_id, 0)
+
+  def adjust(self, delta, category_id=None):
+    with self._lock:
+      if self._total is not None:
+        self._total += delta
+        if category_id is not None:
+          self._by_category[category_id] = self._by_category.get(category_id, 0) + delta
+
+  def invalidate(self):
+    with self._lock:
+      self._total = None
+
+  def _load(self):
+    rows = db.session.execute(question_counts_query()).fetchall()
+    self._by_category = {category_id: count for category_id, count in rows if category_id is not None}
+    self._total = sum(count for _, count in rows)
+    self._loaded_at = time.monotonic()
+
+question_counts = QuestionCounts()
+
+'''
+QuestionIds
+    process-wide cache of the sorted question ids of each category (None for every question),
+    used by the quiz to sample questions without loading the rows
+    Question.insert(), update() and delete() add and discard their id in the loaded tuples
+    of the affected category and of every question, the ttl covers other processes
+    the tuples are never changed: a write swaps in a new one, so readers need no lock
+'''
+class QuestionIds:
+  def __init__(self, ttl=60):
+    self.ttl = ttl
+    self._ids = {}
+    self._lock = threading.Lock()
+
+  def get(self, category_id=None):
+    with self._lock:
+      entry = self._ids.get(category_id)
+      if entry is None or time.monotonic() - entry[0] > self.ttl:
+        entry = (time.monotonic(), tuple(question_id for question_id, in db.session.execute(question_ids_query(category_id))))
+        self._ids[category_id] = entry
+      return entry[1]
+
+  def add(self, question_id, category_id):
+    with self._lock:
+      for key in self._loaded(category_id):
+        loaded_at, ids = self._ids[key]
+        index = bisect.bisect_left(ids, question_id)
+        if index == len(ids) or ids[index] != question_id:
+          self._ids[key] = (loaded_at, ids[:index] + (question_id,) + ids[index:])
+
+  def discard(self, question_id, category_id):
+    with self._lock:
+      for key in self._loaded(category_id):
+        loaded_at, ids = self._ids[key]
+        index = bisect.bisect_left(ids, question_id)
+        if index < len(ids) and ids[index] == question_id:
+          self._ids[key] = (loaded_at, ids[:index] + ids[index + 1:])
+
+  def invalidate(self):
+    with self._lock:
+      self._ids = {}
+
+  def _loaded(self, category_id):
+    # the keys of the loaded tuples a question of category_id belongs to
+    keys = [None] if category_id is None else [None, category_id]
+    return [key for key in keys if key in self._ids]
+
+question_ids = QuestionIds()
+
+'''
+CategoryCache
+    process-wide cache of the category list, the rows as the endpoints return them
+    and the serialized /categories body, computed once per version
+    Category.insert(), update() and delete() bump the version
+    with a shared backend the version is kept there (fsnd_shared.shared_version),
+    so a write in one process reloads every process, otherwise the ttl covers other processes
+'''
+class CategoryCache:
+  def __init__(self, ttl=300, backend=None, key='trivia:categories:version'):
+    self.ttl = ttl
+    self.shared = SharedVersion(backend, key)
+    self._entry = None
+    self._lock = threading.Lock()
+
+  def categories(self):
+    return self._get()['categories']
+
+  def body(self):
+    return self._get()['body']
+
+  def invalidate(self):
+    with self._lock:
+      self._entry = None
+    self.shared.bump()
+
+  def _get(self):
+    version = self.shared.get()
+    with self._lock:
+      entry = self._entry
+      if entry is None or entry['version'] != version or \
+          (version is None and time.monotonic() - entry['loaded_at'] > self.ttl):
+        categories = [[type] for type, in db.session.execute(categories_query())]
+        entry = {
+          'version': version,
+          'loaded_at': time.monotonic(),
+          'categories': categories,
+          'body': json.dumps({
+            'success': True,
+            'categories': categories,
+            'total_categories': len(categories)
+          })
+        }
+        self._entry = entry
+      return entry
+
+# CATEGORY_CACHE_REDIS_URL names the shared version backend
+category_cache = CategoryCache(ttl=int(os.environ.get('CATEGORY_CACHE_TTL', 300)), backend=redis_backend('CATEGORY_CACHE_REDIS_URL'))
 
 '''
 Question
@@ -25,11 +273,16 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # serves the category filter and the id ordering of the category listing
+    Index('questions_category_id_idx', 'category', 'id'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  # active_history loads the previous category even when it was expired, for update()
+  category = column_property(Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL')), active_history=True)
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -41,13 +294,24 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    question_counts.adjust(1, self.category)
+    question_ids.add(self.id, self.category)
   
   def update(self):
+    # the category before the change, to move the id between the cached tuples
+    previous = inspect(self).attrs.category.history.deleted
     db.session.commit()
+    question_counts.invalidate()
+    if previous:
+      question_ids.discard(self.id, previous[0])
+      question_ids.add(self.id, self.category)
 
   def delete(self):
+    question_id, category_id = self.id, self.category
     db.session.delete(self)
     db.session.commit()
+    question_counts.adjust(-1, category_id)
+    question_ids.discard(question_id, category_id)
 
   def format(self):
     return {
@@ -71,8 +335,56 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    db.session.commit()
+    category_cache.invalidate()
+
+  def update(self):
+    db.session.commit()
+    category_cache.invalidate()
+
+  def delete(self):
+    db.session.delete(self)
+    db.session.commit()
+    category_cache.invalidate()
+
   def format(self):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Query builders
+  the statements behind the caches and the endpoints, built on the tables rather than the session
+  so the async app (async_app.py) runs the same statements on its own drivers
+  question rows select question_columns() first, in format_question() order
+'''
+def question_columns():
+  return [Question.id, Question.question, Question.answer, Question.category, Question.difficulty]
+
+def format_question(row):
+  return {
+    'id': row[0],
+    'question': row[1],
+    'answer': row[2],
+    'category': row[3],
+    'difficulty': row[4]
+  }
+
+def question_query(question_id):
+  return select(question_columns()).where(Question.id == question_id)
+
+def question_ids_query(category_id=None):
+  query = select([Question.id])
+  if category_id is not None:
+    query = query.where(Question.category == category_id)
+  return query.order_by(Question.id)
+
+def question_counts_query():
+  # every category total in one grouped query
+  return select([Question.category, func.count(Question.id)]).group_by(Question.category)
+
+def categories_query():
+  return select([Category.type]).order_by(Category.id)
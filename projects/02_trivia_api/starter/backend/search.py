@@ -0,0 +1,83 @@
+import re
+from sqlalchemy import func, literal_column, select, table, column
+
+from models import db, Question, question_columns, format_question, search_index
+
+'''
+Question search
+  runs against the index built by models.create_search_index(), a substring match until it exists
+  every search term is matched as a word prefix, so "tit" finds "title"
+  the statements are shared with the async app, which runs them on its own drivers
+'''
+
+questions_fts = table('questions_fts', column('rowid'), column('rank'))
+
+def search_words(term):
+  return re.findall(r'\w+', term.lower())
+
+def search_tsquery(words):
+  return func.to_tsquery('english', ' & '.join(word + ':*' for word in words))
+
+'''
+tsquery_check(term, dialect)
+  on PostgreSQL, the statement selecting the number of nodes of the tsquery of term,
+  0 for a query of stop words only, which is empty and would match nothing
+  None when there is nothing to check
+'''
+def tsquery_check(term, dialect):
+  words = search_words(term)
+  if not words or dialect != 'postgresql':
+    return None
+  return select([func.numnode(search_tsquery(words))])
+
+'''
+search_query(term, dialect, indexed)
+  selects the question_columns() of the questions matching term, best match first,
+  followed by the total number of matches
+  terms the index cannot serve, no words at all or an empty tsquery, and a database without the
+  index (indexed False for both) fall back to the case-insensitive substring match the search
+  used before the index
+'''
+def search_query(term, dialect, indexed=True):
+  words = search_words(term)
+  columns = question_columns() + [func.count().over()]
+  if words and indexed and dialect == 'postgresql':
+    tsquery = search_tsquery(words)
+    vector = literal_column('questions.search_vector')
+    return select(columns).where(vector.op('@@')(tsquery)).order_by(func.ts_rank(vector, tsquery).desc(), Question.id)
+  if words and indexed:
+    # bm25 ranking is only available while scanning the fts table itself, so match in a subquery
+    match = ' '.join('"{}"*'.format(word) for word in words)
+    matches = select([questions_fts.c.rowid, questions_fts.c.rank]).where(literal_column('questions_fts').op('MATCH')(match)).alias('matches')
+    return select(columns).select_from(Question.__table__.join(matches, matches.c.rowid == Question.id)).order_by(matches.c.rank, Question.id)
+  # escaped with ! rather than a backslash, whose literal depends on standard_conforming_strings
+  pattern = '%{}%'.format(term.replace('!', '!!').replace('%', '!%').replace('_', '!_'))
+  return select(columns).where(Question.question.ilike(pattern, escape='!')).order_by(Question.id)
+
+'''
+search_page(query, page, per_page) and search_count(query)
+  one page of a search_query(), the match total is in every row of it,
+  and the count of all matches for a page past the end, which has no rows to carry it
+'''
+def search_page(query, page, per_page):
+  return query.limit(per_page).offset((page - 1) * per_page)
+
+def search_count(query):
+  return select([func.count()]).select_from(query.order_by(None).alias('matches_count'))
+
+'''
+search_questions(term, page, per_page)
+  returns the formatted questions matching term, best match first, and the total number of matches
+'''
+def search_questions(term, page, per_page):
+  if not term.strip():
+    return [], 0
+  dialect = db.engine.dialect.name
+  indexed = search_index.exists()
+  check = tsquery_check(term, dialect) if indexed else None
+  query = search_query(term, dialect, indexed and (check is None or bool(db.session.execute(check).scalar())))
+
+  rows = db.session.execute(search_page(query, page, per_page)).fetchall()
+  if not rows:
+    return [], 0 if page == 1 else db.session.execute(search_count(query)).scalar()
+  return [format_question(row) for row in rows], rows[0][5]
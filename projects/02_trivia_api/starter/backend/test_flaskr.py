@@ -1,22 +1,56 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import create_search_index, db, Question, Category, question_counts, question_ids, category_cache, search_index
+
+try:
+    # the async app is optional, see requirements-async.txt
+    from starlette.testclient import TestClient
+    from async_app import create_async_app
+except ImportError:
+    create_async_app = None
+
+
+def worker_database_path():
+    """The test database, TRIVIA_TEST_DATABASE_URL or trivia_test.
+
+    Under pytest-xdist every worker gets its own copy, trivia_test_gw0, trivia_test_gw1, ...
+    cloned from the test database at the start of the run.
+    """
+    database_path = os.environ.get('TRIVIA_TEST_DATABASE_URL', "postgresql://{}/{}".format('postgres:postgresql@localhost:5432', "trivia_test"))
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if worker is None:
+        return database_path
+
+    url = make_url(database_path)
+    template = url.database
+    url.database = 'postgres'
+    engine = create_engine(url, isolation_level='AUTOCOMMIT')
+    with engine.connect() as connection:
+        connection.execute('DROP DATABASE IF EXISTS "{}_{}"'.format(template, worker))
+        connection.execute('CREATE DATABASE "{0}_{1}" TEMPLATE "{0}"'.format(template, worker))
+    engine.dispose()
+    url.database = '{}_{}'.format(template, worker)
+    return str(url)
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Initialize the app and the schema once for the test case."""
+        cls.database_path = worker_database_path()
+        cls.app = create_app({'SQLALCHEMY_DATABASE_URI': cls.database_path})
+        create_search_index()
+
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Define test variables and run the test in a transaction."""
         self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgresql://{}/{}".format('postgres:postgresql@localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
 
         self.new_question ={'question': 'Test Q', 'answer':'Test Answer', 'difficulty':1, 'category':'1'}
         self.new_question1 ={'question': None, 'answer':None, 'difficulty':None, 'category':None}
@@ -25,16 +59,32 @@ class TriviaTestCase(unittest.TestCase):
         self.new_question4 ={'question': 'Test Q', 'answer':None, 'difficulty':1, 'category':'1'}
         self.new_question5 ={'question': None, 'answer':'Test Answer', 'difficulty':1, 'category':'1'}
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-    
+        # the app session joins an outer transaction rolled back by tearDown,
+        # commits only release a savepoint which is restarted right away
+        self.connection = db.engine.connect()
+        self.connection.begin()
+        self.session = db.session
+        db.session = db.create_scoped_session(options={'bind': self.connection, 'binds': {}})
+        event.listen(db.session, 'after_transaction_end', self.restart_savepoint)
+        db.session.begin_nested()
+
+    @staticmethod
+    def restart_savepoint(session, transaction):
+        if transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
+
     def tearDown(self):
-        """Executed after reach test"""
-        pass
+        """Executed after reach test, discards everything the test wrote"""
+        db.session.remove()
+        db.session = self.session
+        # returning the connection to the pool rolls back the outer transaction
+        # and the savepoints left open by the requests
+        self.connection.close()
+        question_counts.invalidate()
+        question_ids.invalidate()
+        category_cache.invalidate()
+        search_index.invalidate()
 
     """
     Done
@@ -48,6 +98,22 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         
 
+    def test_retrieve_categories_after_category_insert(self):
+        res = self.client().get('/categories')
+        before = json.loads(res.data)['total_categories']
+        with self.app.app_context():
+            # the app context uses the session swapped in by setUp, inside the test transaction
+            self.assertIs(db.session.connection(), self.connection)
+            category = Category('Test category')
+            category.insert()
+            res = self.client().get('/categories')
+            data = json.loads(res.data)
+            category.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_categories'], before + 1)
+        self.assertEqual(data['categories'][-1], ['Test category'])
+
     def test_404_retrieve_categories(self):
         res = self.client().get('/categories/1')
         data = json.loads(res.data)
@@ -78,15 +144,52 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
     
-    #comment success delete test because question table still empty 
-    
-    # def test_delete_question(self):
-    #     res = self.client().delete('/questions/1')
-    #     data = json.loads(res.data)
-    #     question = Question.query.filter(Question.id == 1).one_or_none()
-    #     self.assertEqual(res.status_code, 200)
-    #     self.assertEqual(data['success'], True)
-    #     self.assertEqual(question, None)
+    def test_get_questions_cursor(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('next_cursor', data)
+
+        if data['next_cursor']:
+            res = self.client().get('/questions?cursor={}'.format(data['next_cursor']))
+            next_page = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(next_page['questions'][0]['id'] > data['questions'][-1]['id'])
+
+    def test_400_get_questions_invalid_cursor(self):
+        res = self.client().get('/questions?cursor=notacursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_get_category_questions(self):
+        res = self.client().get('/categories/0/questions?page=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']) <= data['total_questions'])
+        for question in data['questions']:
+            self.assertEqual(question['category'], 1)
+
+    def test_delete_question(self):
+        with self.app.app_context():
+            self.assertIs(db.session.connection(), self.connection)
+            question = Question('Test Q', 'Test Answer', 1, 1)
+            question.insert()
+            question_id = question.id
+        res = self.client().delete('/questions/{}'.format(question_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted_question_id'], question_id)
+        with self.app.app_context():
+            self.assertIs(db.session.connection(), self.connection)
+            self.assertEqual(Question.query.get(question_id), None)
 
     def test_404_delete_question(self):
         res = self.client().delete('/questions/1000')
@@ -100,9 +203,32 @@ class TriviaTestCase(unittest.TestCase):
         res = self.client().post('/questions', json=self.new_question)
         data = json.loads(res.data)
 
-        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.status_code, 201)
         self.assertEqual(data['success'], True)
 
+    def test_create_question_returns_created_question(self):
+        res = self.client().post('/questions', json=self.new_question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['question']['id'], data['created'])
+        self.assertEqual(data['question']['question'], 'Test Q')
+        self.assertNotIn('questions', data)
+        self.assertTrue(res.headers['Location'].endswith('/questions/{}'.format(data['created'])))
+        with self.app.app_context():
+            self.assertEqual(data['total_questions'], Question.query.count())
+
+        res = self.client().get(res.headers['Location'])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['question'], data['question'])
+
+    def test_404_get_question(self):
+        res = self.client().get('/questions/1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_422_search_post_questions(self):
         res = self.client().post('/questions', json={})
         data = json.loads(res.data)
@@ -158,6 +284,45 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_search_post_questions_page(self):
+        res = self.client().post('/questions', json={'searchTerm': 'title', 'page': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']) <= 10)
+        self.assertTrue(len(data['questions']) <= data['total_questions'])
+
+
+    def test_search_finds_known_question(self):
+        res = self.client().post('/questions', json={'searchTerm': 'cassius'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("What boxer's original name is Cassius Clay?", [question['question'] for question in data['questions']])
+
+    def test_search_stop_words_falls_back_to_substring(self):
+        res = self.client().post('/questions', json={'searchTerm': 'what is'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('What is the largest lake in Africa?', [question['question'] for question in data['questions']])
+        self.assertEqual(data['total_questions'], 2)
+
+    def test_search_before_the_index_is_built(self):
+        # the column and its index are dropped inside the test transaction, rolled back by tearDown
+        with self.app.app_context():
+            db.session.execute('ALTER TABLE questions DROP COLUMN search_vector')
+        search_index.invalidate()
+
+        res = self.client().post('/questions', json={'searchTerm': 'cassius', 'page': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question['question'] for question in data['questions']], ["What boxer's original name is Cassius Clay?"])
+        self.assertEqual(data['total_questions'], 1)
+        with self.app.app_context():
+            self.assertFalse(search_index.exists())
     
     def test_422_search_post_questions6(self):
         res = self.client().post('/questions', json={'searchTerm': ''})
@@ -183,6 +348,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'unprocessable')
 
+    def test_pool_health(self):
+        res = self.client().get('/health/pool')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(data['checkouts'], data['checkins'])
+        self.assertTrue(data['pools'])
+
     def test_quizzes(self):
         res = self.client().post('/quizzes', json={'previous_questions': [] , 'quiz_category': {'type':'click' , 'id': '0' }})
         data = json.loads(res.data)
@@ -190,6 +363,54 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_quizzes_skips_previous_questions(self):
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json={'previous_questions': previous_questions , 'quiz_category': {'type':'click' , 'id': '0' }})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            if 'question' not in data:
+                break
+            self.assertNotIn(data['question']['id'], previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        self.assertEqual(data['success'], True)
+
+    def test_quiz_question_ids_follow_question_writes(self):
+        with self.app.app_context():
+            science = question_ids.get(1)
+            art = question_ids.get(2)
+            every = question_ids.get()
+
+            question = Question('Test Q', 'Test Answer', 1, 1)
+            question.insert()
+            # the tuples handed out are never changed, writes swap in new ones
+            self.assertNotIn(question.id, science)
+            self.assertIn(question.id, question_ids.get(1))
+            self.assertIn(question.id, question_ids.get())
+
+            question.category = 2
+            question.update()
+            self.assertNotIn(question.id, question_ids.get(1))
+            self.assertIn(question.id, question_ids.get(2))
+
+            # the previous category is known even when it was expired before the change
+            db.session.expire(question, ['category'])
+            question.category = 3
+            question.update()
+            self.assertNotIn(question.id, question_ids.get(2))
+            self.assertIn(question.id, question_ids.get(3))
+
+            question_id = question.id
+            question.delete()
+            self.assertNotIn(question_id, question_ids.get(3))
+            self.assertNotIn(question_id, question_ids.get())
+            self.assertEqual(question_ids.get(1), science)
+            self.assertEqual(question_ids.get(2), art)
+            self.assertEqual(question_ids.get(), every)
+            self.assertEqual(list(question_ids.get()), sorted(question_ids.get()))
+
     def test_422_quizzes(self):
         res = self.client().post('/quizzes', json={'previous_questions': [] , 'quiz_category': {'type':'general' , 'id': 'sss' }})
         data = json.loads(res.data)
@@ -206,6 +427,41 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'unprocessable')
 
+    @unittest.skipIf(create_async_app is None, 'the async app requirements are not installed')
+    def test_async_app_matches_sync_app(self):
+        with self.app.app_context():
+            science = list(question_ids.get(1))
+        cursor = json.loads(self.client().get('/questions').data)['next_cursor']
+        requests = [
+            ('GET', '/categories', None),
+            ('GET', '/questions', None),
+            ('GET', '/questions?page=2', None),
+            ('GET', '/questions?cursor={}'.format(cursor), None),
+            ('GET', '/questions?cursor=garbage', None),
+            ('GET', '/categories/0/questions', None),
+            ('GET', '/questions/{}'.format(science[0]), None),
+            ('GET', '/questions/1000', None),
+            ('DELETE', '/questions/1000', None),
+            ('POST', '/questions', {'searchTerm': 'title'}),
+            ('POST', '/questions', {'searchTerm': 'what is'}),
+            ('POST', '/questions', {'searchTerm': 'title', 'page': 5}),
+            ('POST', '/questions', {'searchTerm': ''}),
+            ('POST', '/questions', {'question': None}),
+            # every question of the category but the last was played, so the quiz has one answer
+            ('POST', '/quizzes', {'previous_questions': science[:-1], 'quiz_category': {'type': 'Science', 'id': 0}}),
+            ('POST', '/quizzes', {'previous_questions': science, 'quiz_category': {'type': 'Science', 'id': 0}}),
+            ('POST', '/quizzes', {}),
+        ]
+        # the async app reads the committed test database on its own connections
+        with TestClient(create_async_app(self.database_path)) as async_client:
+            for method, path, body in requests:
+                with self.subTest(method=method, path=path, body=body):
+                    expected = self.client().open(path, method=method, json=body)
+                    response = async_client.request(method, path, json=body)
+
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response.json(), json.loads(expected.data))
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -14,6 +14,7 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      searchTerm: null,
     }
   }
 
@@ -41,6 +42,11 @@ class QuestionView extends Component {
   }
 
   selectPage(num) {
+    // the pages of a search are pages of its results
+    if (this.state.searchTerm) {
+      this.submitSearch(this.state.searchTerm, num);
+      return;
+    }
     this.setState({page: num}, () => this.getQuestions());
   }
 
@@ -66,7 +72,8 @@ class QuestionView extends Component {
         this.setState({
           questions: result.questions,
           totalQuestions: result.total_questions,
-          currentCategory: result.current_category })
+          currentCategory: result.current_category,
+          searchTerm: null })
         return;
       },
       error: (error) => {
@@ -76,13 +83,13 @@ class QuestionView extends Component {
     })
   }
 
-  submitSearch = (searchTerm) => {
+  submitSearch = (searchTerm, page = 1) => {
     $.ajax({
       url: `/questions`, //TODO: update request URL
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({searchTerm: searchTerm}),
+      data: JSON.stringify({searchTerm: searchTerm, page: page}),
       xhrFields: {
         withCredentials: true
       },
@@ -91,7 +98,9 @@ class QuestionView extends Component {
         this.setState({
           questions: result.questions,
           totalQuestions: result.total_questions,
-          currentCategory: result.current_category })
+          currentCategory: result.current_category,
+          searchTerm: searchTerm,
+          page: page })
         return;
       },
       error: (error) => {
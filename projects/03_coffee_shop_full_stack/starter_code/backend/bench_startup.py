@@ -0,0 +1,63 @@
+'''
+Startup benchmark
+
+Measures what a worker pays when it starts, against a throwaway sqlite database:
+    import     importing src.api in a fresh interpreter (what every gunicorn worker does)
+    bootstrap  `flask bootstrap-db` on a current schema (the per-deploy check)
+    reset      the old import-time db_drop_and_create_all(), for comparison
+
+Usage, from the backend directory:
+    python bench_startup.py [--runs 10]
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='coffee shop worker startup benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + database
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from src.api import app
+    from src.database.models import bootstrap_db, db_drop_and_create_all
+
+    with app.app_context():
+        bootstrap_db()
+
+    def import_app():
+        subprocess.run([sys.executable, '-c', 'import src.api'], check=True, env=os.environ.copy(),
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def bootstrap():
+        with app.app_context():
+            bootstrap_db()
+
+    def reset():
+        with app.app_context():
+            db_drop_and_create_all()
+
+    for name, fn in [('import', import_app), ('bootstrap', bootstrap), ('reset', reset)]:
+        median, worst = timed(fn, args.runs)
+        print('{:<10} median {:8.1f} ms   max {:8.1f} ms'.format(name, median, worst))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""json recipe and pre-serialized drink fragments
+
+Revision ID: 823eee242392
+Revises: ee9984ad9e08
+Create Date: 2026-10-18 10:04:51.230871
+
+"""
+import ast
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '823eee242392'
+down_revision = 'ee9984ad9e08'
+branch_labels = None
+depends_on = None
+
+
+def parse_recipe(value):
+    # rows written by the old api hold str(recipe), a python repr with single quotes,
+    # rows written by hand hold json
+    try:
+        recipe = json.loads(value)
+    except ValueError:
+        recipe = ast.literal_eval(value)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    return [{'color': r.get('color'), 'name': r.get('name'), 'parts': r.get('parts')} for r in recipe]
+
+
+def upgrade():
+    op.add_column('drink', sa.Column('short_json', sa.Text(), nullable=True))
+    op.add_column('drink', sa.Column('long_json', sa.Text(), nullable=True))
+    postgresql_db = op.get_bind().dialect.name == 'postgresql'
+    if postgresql_db:
+        # json text can outgrow the varchar(180) of the repr
+        op.alter_column('drink', 'recipe', type_=sa.Text())
+
+    # rewrite every recipe as json and fill the fragments Drink.serialize() keeps
+    drink = sa.table('drink', sa.column('id', sa.Integer), sa.column('title', sa.String), sa.column('recipe', sa.Text),
+                     sa.column('short_json', sa.Text), sa.column('long_json', sa.Text))
+    connection = op.get_bind()
+    for drink_id, title, value in connection.execute(sa.select([drink.c.id, drink.c.title, drink.c.recipe])).fetchall():
+        recipe = parse_recipe(value)
+        short = [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+        connection.execute(drink.update().where(drink.c.id == drink_id).values(
+            recipe=json.dumps(recipe),
+            short_json=json.dumps({'id': drink_id, 'title': title, 'recipe': short}),
+            long_json=json.dumps({'id': drink_id, 'title': title, 'recipe': recipe})))
+
+    # sqlite stores json as text already, only postgresql needs the column converted
+    if postgresql_db:
+        op.alter_column('drink', 'recipe', type_=postgresql.JSONB(), postgresql_using='recipe::jsonb')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('drink', 'recipe', type_=sa.String(length=180), postgresql_using='recipe::text')
+    with op.batch_alter_table('drink') as batch_op:
+        batch_op.drop_column('long_json')
+        batch_op.drop_column('short_json')
@@ -1,24 +1,61 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, bootstrap_db, setup_db, Drink
 from .auth.auth import AuthError, requires_auth, check_permissions
+from .response_cache import cached_response
+from fsnd_shared.engine_config import pool_metrics
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
 '''
-@TODO uncomment the following line to initialize the datbase
-!! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
-!! NOTE THIS MUST BE UNCOMMENTED ON FIRST RUN
+Database commands
+    the schema is no longer dropped and recreated at import, so starting a worker never touches it
+    flask bootstrap-db  creates or upgrades the schema, a no-op when it is current (run once per deploy)
+    flask reset-db      !! DROPS ALL RECORDS and starts the db from scratch
 '''
-db_drop_and_create_all()
+@app.cli.command('bootstrap-db')
+def bootstrap_db_command():
+    print('database ' + bootstrap_db())
+
+@app.cli.command('reset-db')
+def reset_db_command():
+    db_drop_and_create_all()
+    print('database reset')
 
 ## ROUTES
+
+'''
+GET /health/pool
+    the connection pool metrics of this worker, see fsnd_shared.engine_config
+    it requires the 'get:pool-metrics' permission
+'''
+@app.route('/health/pool', methods=['GET'])
+@requires_auth
+def pool_health(payload):
+    check_permissions('get:pool-metrics', payload)
+    return jsonify(pool_metrics.snapshot())
+
+'''
+drinks_response(representation)
+    streams {"success": true, "drinks": [...]} from the pre-serialized drink fragments
+'''
+def drinks_response(representation):
+    fragments = Drink.fragments(representation)
+
+    def generate():
+        yield '{"success": true, "drinks": ['
+        for index, fragment in enumerate(fragments):
+            yield fragment if index == 0 else ',' + fragment
+        yield ']}'
+
+    return Response(generate(), mimetype='application/json')
+
 '''
 @TODO implement endpoint
     GET /drinks
@@ -28,15 +65,9 @@ db_drop_and_create_all()
         or appropriate status code indicating reason for failure
 '''
 @app.route('/drinks',methods=['GET'])
+@cached_response
 def get_drinks():
-    drinks = Drink.query.all()
-    DrinkShort =[]
-    for drink in drinks:
-        DrinkShort.append(Drink.short(drink))
-    return jsonify({
-        'success': True,
-        'drinks': DrinkShort
-    })
+    return drinks_response('short')
 '''
 @TODO implement endpoint
     GET /drinks-detail
@@ -49,14 +80,7 @@ def get_drinks():
 @requires_auth
 def get_drinks_detail(payload):
     check_permissions("get:drinks-detail", payload)
-    drinks = Drink.query.all()
-    DrinkShort =[]
-    for drink in drinks:
-        DrinkShort.append(Drink.long(drink))
-    return jsonify({
-        'success': True,
-        'drinks': DrinkShort
-    })
+    return drinks_response('long')
 
 '''
 @TODO implement endpoint
@@ -78,7 +102,7 @@ def post_drink(payload):
     try:
         DrinkObj = Drink()
         DrinkObj.title = title
-        DrinkObj.recipe = str(recipe)
+        DrinkObj.recipe = recipe
         returnedDrinks=[]
         returnedDrinks.append(DrinkObj.title)
         DrinkObj.insert()
@@ -113,8 +137,10 @@ def update_drink(payload, drink_id):
     title = body.get('title', None)
     recipe = body.get('recipe', None)
     try:
-        drink.title = title 
-        drink.recipe = str(recipe)
+        if title is not None:
+            drink.title = title
+        if recipe is not None:
+            drink.recipe = recipe
         drink.update()
         returnedDrinks=[]
         return jsonify({
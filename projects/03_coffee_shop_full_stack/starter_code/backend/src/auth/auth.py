@@ -1,14 +1,22 @@
+import os
 import json
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import jwks_store_from_env
+from fsnd_shared.token_cache import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'dev-paula-fwd.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee_shopAPIIdentifire'
 
+# shared by every request in the process, see jwks.py
+jwks_store = jwks_store_from_env(AUTH0_DOMAIN)
+# payloads of tokens that already passed verify_decode_jwt, see fsnd_shared/token_cache.py
+token_cache = VerifiedTokenCache(maxsize=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -104,12 +112,10 @@ def check_permissions(permission, payload):
     return the decoded payload
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+    !!NOTE the key set is cached process-wide by jwks_store instead of being fetched per request
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         abort(401)
         # raise AuthError({
@@ -117,15 +123,7 @@ def verify_decode_jwt(token):
         #     'description': 'Authorization malformed.'
         # }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -172,15 +170,20 @@ def verify_decode_jwt(token):
     it should use the verify_decode_jwt method to decode the jwt
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
+
+    !!NOTE a token that was already verified is served from token_cache until its exp
 '''
 def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = verify_decode_jwt(token)
+            except:
+                abort(401)
+            token_cache.put(token, payload)
         return f(payload, *args, **kwargs)
 
     return wrapper
\ No newline at end of file
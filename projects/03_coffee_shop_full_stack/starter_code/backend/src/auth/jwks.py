@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import threading
+from urllib.request import urlopen
+
+
+## JWKS Key Store
+'''
+JWKSKeyStore
+A process-wide cache of the signing keys published by Auth0
+
+    @INPUTS
+        url: the /.well-known/jwks.json endpoint of the tenant
+        path: optional local jwks.json file, used instead of url (offline testing)
+        ttl: seconds a fetched key set is considered fresh
+        min_refetch_interval: minimum seconds between two refetches caused by an unknown kid
+
+    the key set is fetched once and the RSA keys are kept indexed by kid
+    once the ttl expires the cached keys are still served while a single
+    background thread refreshes them, an unknown kid waits for that refresh
+    an unknown kid triggers at most one synchronous refetch per min_refetch_interval
+'''
+class JWKSKeyStore:
+    def __init__(self, url=None, path=None, ttl=3600, min_refetch_interval=30):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = 0
+        self._refreshing = False
+        self._refreshed = threading.Event()
+        self._refreshed.set()
+        self._lock = threading.Lock()
+
+    '''
+    get_key(kid)
+        returns the RSA key dict for kid, or None if the tenant does not publish it
+    '''
+    def get_key(self, kid):
+        if self._fetched_at is None:
+            self.refresh()
+        elif time.monotonic() - self._fetched_at > self.ttl and self._may_refetch():
+            self._refresh_in_background()
+
+        rsa_key = self._keys.get(kid)
+        if rsa_key is None and not self._refreshed.is_set():
+            # a just rotated key may be in the key set the background refresh is fetching
+            self._refreshed.wait()
+            rsa_key = self._keys.get(kid)
+        if rsa_key is None and self._may_refetch():
+            self.refresh()
+            rsa_key = self._keys.get(kid)
+        return rsa_key
+
+    '''
+    refresh()
+        fetches the key set synchronously and swaps it in
+        concurrent callers wait for the fetch already in flight instead of starting another
+    '''
+    def refresh(self):
+        requested = time.monotonic()
+        with self._lock:
+            if self._fetched_at is not None and self._fetched_at > requested:
+                return
+            self._last_attempt = time.monotonic()
+            jwks = self._load()
+            self._keys = self._index(jwks)
+            self._fetched_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = 0
+
+    def _may_refetch(self):
+        return time.monotonic() - self._last_attempt >= self.min_refetch_interval
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._refreshed.clear()
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # keep serving the previous keys, the next expiry retries
+                pass
+            finally:
+                self._refreshing = False
+                self._refreshed.set()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _load(self):
+        if self.path:
+            with open(self.path) as jwks_file:
+                return json.load(jwks_file)
+        jsonurl = urlopen(self.url)
+        return json.loads(jsonurl.read())
+
+    @staticmethod
+    def _index(jwks):
+        keys = {}
+        for key in jwks.get('keys', []):
+            if key.get('kty') != 'RSA' or 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use'),
+                'n': key['n'],
+                'e': key['e']
+            }
+        return keys
+
+
+'''
+jwks_store_from_env(domain)
+    builds a key store for an Auth0 domain
+    JWKS_PATH, JWKS_CACHE_TTL and JWKS_MIN_REFETCH_INTERVAL override the defaults
+'''
+def jwks_store_from_env(domain):
+    return JWKSKeyStore(
+        url=f'https://{domain}/.well-known/jwks.json',
+        path=os.environ.get('JWKS_PATH'),
+        ttl=int(os.environ.get('JWKS_CACHE_TTL', 3600)),
+        min_refetch_interval=int(os.environ.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+    )
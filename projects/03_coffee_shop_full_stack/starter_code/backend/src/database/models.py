@@ -1,13 +1,26 @@
 import os
-from sqlalchemy import Column, String, Integer
+from numbers import Number
+from sqlalchemy import Column, String, Integer, Text, JSON, inspect, literal_column
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import validates
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, stamp, upgrade
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
 import json
 
+from ..response_cache import response_cache
+from fsnd_shared.engine_config import engine_options, pool_metrics
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
+migrations_dir = os.path.join(project_dir, '..', '..', 'migrations')
+# the revision matching the schema created by the original db_drop_and_create_all()
+initial_revision = 'ee9984ad9e08'
 
 db = SQLAlchemy()
+migrate = Migrate()
 
 '''
 setup_db(app)
@@ -16,18 +29,78 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
+    pool_metrics.attach(db.get_engine(app))
+    migrate.init_app(app, db, directory=migrations_dir)
 
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh
     can be used to initialize a clean database
     !!NOTE you can change the database_filename variable to have multiple verisons of a database
+    !!NOTE this is only run by the explicit `flask reset-db` command, never at import
 '''
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    stamp(directory=migrations_dir)
+
+'''
+bootstrap_db()
+    brings the schema to the latest migration, must run inside an app context
+    it is a no-op (one version lookup) when the schema is already current
+    an empty database is created from the models and stamped instead of replaying every migration
+    a database created before migrations existed is stamped with initial_revision and upgraded
+    returns 'current', 'created' or 'upgraded'
+'''
+def bootstrap_db():
+    config = migrate.get_config(migrations_dir)
+    head = ScriptDirectory.from_config(config).get_current_head()
+    with db.engine.connect() as connection:
+        current = MigrationContext.configure(connection).get_current_revision()
+        tables = inspect(connection).get_table_names()
+
+    if current == head:
+        return 'current'
+    if not tables:
+        db.create_all()
+        stamp(directory=migrations_dir)
+        return 'created'
+    if current is None:
+        stamp(directory=migrations_dir, revision=initial_revision)
+    upgrade(directory=migrations_dir)
+    return 'upgraded'
+
+'''
+validate_recipe(recipe)
+    checks a recipe is [{'color': string, 'name': string, 'parts': number}]
+    a single ingredient dict is accepted and wrapped in a list
+    raises ValueError otherwise
+'''
+def validate_recipe(recipe):
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list) or not recipe:
+        raise ValueError('recipe must be a non empty list of ingredients')
+    for ingredient in recipe:
+        if not isinstance(ingredient, dict):
+            raise ValueError('recipe ingredients must be objects')
+        if not isinstance(ingredient.get('color'), str) or not isinstance(ingredient.get('name'), str):
+            raise ValueError('recipe ingredients need a color and a name')
+        parts = ingredient.get('parts')
+        if not isinstance(parts, Number) or isinstance(parts, bool) or parts <= 0:
+            raise ValueError('recipe ingredient parts must be a positive number')
+    return [{'color': r['color'], 'name': r['name'], 'parts': r['parts']} for r in recipe]
+
+# short form of drink.recipe computed by the database, see Drink.fragments()
+SHORT_RECIPE_SQL = {
+    'postgresql': "(SELECT coalesce(jsonb_agg(jsonb_build_object('color', r->'color', 'parts', r->'parts')), '[]'::jsonb) "
+                  "FROM jsonb_array_elements(drink.recipe) AS r)",
+    'sqlite': "(SELECT json_group_array(json_object('color', json_extract(value, '$.color'), 'parts', json_extract(value, '$.parts'))) "
+              "FROM json_each(drink.recipe))",
+}
 
 '''
 Drink
@@ -38,17 +111,19 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # the ingredients, a native json column (jsonb on postgresql)
+    # the required datatype is [{'color': string, 'name':string, 'parts':number}], see validate_recipe()
+    recipe =  Column(JSON().with_variant(JSONB(), 'postgresql'), nullable=False)
+    # short() and long() serialized to json, refreshed by insert() and update()
+    short_json = Column(Text)
+    long_json = Column(Text)
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.recipe]
         return {
             'id': self.id,
             'title': self.title,
@@ -63,9 +138,48 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
+    @validates('recipe')
+    def check_recipe(self, key, recipe):
+        return validate_recipe(recipe)
+
+    '''
+    serialize()
+        stores the short and long representations as json alongside the row
+        so listings can be served without touching the recipe
+    '''
+    def serialize(self):
+        self.short_json = json.dumps(self.short())
+        self.long_json = json.dumps(self.long())
+
+    '''
+    fragments(representation)
+        json fragments of every drink in the given representation, 'short' or 'long'
+        only the stored fragment column is read for rows that have one,
+        rows without one get the short recipe projected by the database
+        EXAMPLE
+            Drink.fragments('short')
+    '''
+    @classmethod
+    def fragments(cls, representation):
+        column = cls.short_json if representation == 'short' else cls.long_json
+        rows = cls.query.with_entities(cls.id, column).order_by(cls.id).all()
+        missing = [drink_id for drink_id, fragment in rows if fragment is None]
+        if missing:
+            short_recipe_sql = SHORT_RECIPE_SQL.get(db.engine.dialect.name)
+            recipe = cls.recipe
+            if representation == 'short' and short_recipe_sql:
+                recipe = literal_column(short_recipe_sql, type_=JSON)
+            computed = {}
+            for drink_id, title, drink_recipe in cls.query.with_entities(cls.id, cls.title, recipe).filter(cls.id.in_(missing)):
+                if representation == 'short' and not short_recipe_sql:
+                    drink_recipe = [{'color': r['color'], 'parts': r['parts']} for r in drink_recipe]
+                computed[drink_id] = json.dumps({'id': drink_id, 'title': title, 'recipe': drink_recipe})
+            rows = [(drink_id, fragment or computed[drink_id]) for drink_id, fragment in rows]
+        return [fragment for _, fragment in rows]
+
     '''
     insert()
         inserts a new model into a database
@@ -77,7 +191,10 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        self.serialize()
         db.session.commit()
+        response_cache.invalidate()
 
     '''
     delete()
@@ -90,6 +207,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        response_cache.invalidate()
 
     '''
     update()
@@ -101,7 +219,9 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
+        self.serialize()
         db.session.commit()
+        response_cache.invalidate()
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
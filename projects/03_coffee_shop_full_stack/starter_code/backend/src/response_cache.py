@@ -0,0 +1,97 @@
+import os
+import time
+import hashlib
+import threading
+from functools import wraps
+from flask import Response, request
+from fsnd_shared.shared_version import SharedVersion, redis_backend
+
+
+## Response Cache
+'''
+ResponseCache
+A process-wide cache of rendered response bodies, keyed by endpoint and query string
+
+    @INPUTS
+        ttl: seconds an entry is served when there is no shared backend
+        backend: optional client with get and incr (e.g. redis) holding a version shared by every process,
+            see fsnd_shared.shared_version
+        key: the backend key of the version
+
+    entries carry a strong ETag (sha256 of the body)
+    invalidate() drops every entry of this process and bumps the shared version,
+    Drink.insert(), update() and delete() call it
+    with a backend an entry is served while the shared version is unchanged, so a write in one
+    worker reaches every worker, otherwise entries expire after ttl
+    a response computed while an invalidation happened is not stored
+'''
+class ResponseCache:
+    def __init__(self, ttl=60, backend=None, key='coffee:drinks:version'):
+        self.ttl = ttl
+        self.shared = SharedVersion(backend, key)
+        self._entries = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    '''
+    get(key)
+        returns the cached entry for key or None, and the version to pass to set()
+    '''
+    def get(self, key):
+        shared = self.shared.get()
+        with self._lock:
+            version = (self._version, shared)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, version
+            entry_version, stored_at, value = entry
+            if entry_version != version or (shared is None and time.monotonic() - stored_at > self.ttl):
+                del self._entries[key]
+                return None, version
+            return value, version
+
+    def set(self, key, value, version):
+        with self._lock:
+            if version[0] == self._version:
+                self._entries[key] = (version, time.monotonic(), value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = {}
+            self._version += 1
+        self.shared.bump()
+
+
+# RESPONSE_CACHE_REDIS_URL names the shared version backend
+response_cache = ResponseCache(ttl=int(os.environ.get('RESPONSE_CACHE_TTL', 60)), backend=redis_backend('RESPONSE_CACHE_REDIS_URL'))
+
+
+'''
+@cached_response decorator method
+    serves the decorated public GET endpoint from response_cache
+    answers If-None-Match with 304 when the ETag still matches
+    only 200 responses are cached
+'''
+def cached_response(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        key = (request.path, request.query_string)
+        entry, version = response_cache.get(key)
+        if entry is None:
+            response = f(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = (body, hashlib.sha256(body).hexdigest(), response.mimetype)
+            response_cache.set(key, entry, version)
+
+        body, etag, mimetype = entry
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
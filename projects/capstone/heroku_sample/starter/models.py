@@ -1,7 +1,10 @@
-from sqlalchemy import Column, String, create_engine
+import os
+from sqlalchemy import Column, String, Integer, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_shared.engine_config import engine_options, pool_metrics
+
 database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
@@ -13,8 +16,10 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
+    pool_metrics.attach(db.get_engine(app))
     db.create_all()
 
 
@@ -0,0 +1,120 @@
+import os
+import threading
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+
+'''
+Engine configuration
+    setup_db() passes engine_options() as SQLALCHEMY_ENGINE_OPTIONS, read from the environment:
+
+    DB_POOL                 'null' disables pooling (NullPool), use it behind pgbouncer
+    DB_POOL_SIZE            connections kept open per process (default 5)
+    DB_MAX_OVERFLOW         extra connections allowed under burst load (default 10)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection before failing (default 30)
+    DB_POOL_RECYCLE         seconds after which a connection is replaced (default 1800)
+    DB_POOL_PRE_PING        'false' skips the liveness check on checkout (default true)
+    DB_STATEMENT_TIMEOUT    postgresql statement_timeout in milliseconds (default unset)
+
+    sizing options are only applied to servers, sqlite keeps its own pool
+'''
+def engine_options(database_path, environ=os.environ):
+    url = make_url(database_path)
+    options = {
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() != 'false'
+    }
+
+    if environ.get('DB_POOL', '').lower() == 'null':
+        options['poolclass'] = NullPool
+    elif url.get_backend_name() != 'sqlite':
+        options['pool_size'] = int(environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(environ.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(environ.get('DB_POOL_TIMEOUT', 30))
+        options['pool_recycle'] = int(environ.get('DB_POOL_RECYCLE', 1800))
+
+    timeout = statement_timeout(database_path, environ)
+    if timeout is not None:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(timeout)}
+    return options
+
+'''
+statement_timeout(database_path, environ)
+    DB_STATEMENT_TIMEOUT in milliseconds for postgresql urls, None when unset or for other databases
+    engine_options() passes it to psycopg2, drivers outside SQLAlchemy (asyncpg) set it themselves
+'''
+def statement_timeout(database_path, environ=os.environ):
+    value = environ.get('DB_STATEMENT_TIMEOUT')
+    if not value or make_url(database_path).get_backend_name() != 'postgresql':
+        return None
+    return int(value)
+
+'''
+PoolMetrics
+    counts pool events of the engines it is attached to, see snapshot()
+    setup_db() attaches the app engine, apps opt in to serving the snapshot, see add_pool_health_route()
+'''
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = []
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+
+    def attach(self, engine):
+        if engine in self._engines:
+            return
+        self._engines.append(engine)
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'pools': [engine.pool.status() for engine in self._engines]
+            }
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+pool_metrics = PoolMetrics()
+
+
+'''
+add_pool_health_route(app, metrics)
+    serves metrics.snapshot() as json at GET /health/pool, for dashboards and load balancers
+    watching connection pressure (checked_out against the pool size, invalidations)
+    the route has no authentication, apps behind auth serve the snapshot from their own protected route
+'''
+def add_pool_health_route(app, metrics=pool_metrics):
+    if 'pool_health' in app.view_functions:
+        return
+    app.add_url_rule('/health/pool', 'pool_health', lambda: jsonify(metrics.snapshot()))
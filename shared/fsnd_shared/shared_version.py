@@ -0,0 +1,43 @@
+import os
+
+
+'''
+SharedVersion(backend, key)
+    a version number kept under key in a shared backend (any client with get and incr, e.g. redis),
+    so a process that bumps it invalidates the caches of every process reading it
+    get() is None without a backend or while it is unreachable, callers then fall back to a ttl
+'''
+class SharedVersion:
+    def __init__(self, backend=None, key='version'):
+        self.backend = backend
+        self.key = key
+
+    def get(self):
+        if self.backend is None:
+            return None
+        try:
+            return int(self.backend.get(self.key) or 0)
+        except Exception:
+            # an unreachable backend falls back to the ttl
+            return None
+
+    def bump(self):
+        if self.backend is None:
+            return
+        try:
+            self.backend.incr(self.key)
+        except Exception:
+            pass
+
+
+'''
+redis_backend(variable, environ)
+    the redis client for the url in the environment variable, None when it is unset
+    redis is only imported when it is configured
+'''
+def redis_backend(variable, environ=os.environ):
+    url = environ.get(variable)
+    if not url:
+        return None
+    import redis
+    return redis.Redis.from_url(url)
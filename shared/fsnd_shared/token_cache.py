@@ -0,0 +1,79 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+## Verified Token Cache
+'''
+VerifiedTokenCache
+An LRU of already verified jwt payloads, keyed by a sha256 digest of the token
+
+    @INPUTS
+        maxsize: maximum number of payloads kept, the least recently used is evicted first
+
+    a payload is only served while its 'exp' claim is in the future
+    tokens without an 'exp' claim are never cached
+    hits and misses are counted, see stats()
+'''
+class VerifiedTokenCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    '''
+    get(token)
+        returns the cached payload for token, or None if it was never verified or has expired
+    '''
+    def get(self, token):
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return payload
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    '''
+    put(token, payload)
+        remembers a payload returned by verify_decode_jwt(token)
+    '''
+    def put(self, token, payload):
+        expires_at = payload.get('exp') if isinstance(payload, dict) else None
+        if not isinstance(expires_at, (int, float)) or expires_at <= time.time():
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (expires_at, payload)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+    @staticmethod
+    def _digest(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
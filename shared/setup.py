@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name='fsnd-shared',
+    version='0.1.0',
+    description='Helpers shared by the Full-Stack Nanodegree apps',
+    packages=['fsnd_shared'],
+    install_requires=['Flask', 'SQLAlchemy'],
+)